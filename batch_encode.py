@@ -0,0 +1,165 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Batched SAM image encoding
+#   SamPredictor.set_image runs the image encoder on one image at a time.
+#   encode_batch preprocesses N images exactly as set_image does
+#   (ResizeLongestSide to the encoder's img_size, then Sam.preprocess:
+#   normalization and padding), runs the encoder once on the Nx3x1024x1024
+#   batch and returns one encoding per image, in the format of the
+#   embedding cache entries: restore_predictor puts a predictor in the state
+#   set_image would have left it in, so prompts and decoding are unchanged.
+#   A batch of 1 is the computation of set_image; larger batches agree with
+#   it up to float rounding (the matmuls are blocked differently).
+# The global attention blocks of a ViT encoder hold a few heads x tokens^2
+# score maps per image, ~2.5 GB for ViT-B and ~3.4 GB for ViT-H at 1024:
+# batch_size=0 picks the largest batch that fits the free memory
+# (auto_batch_size). On CUDA, a batch that still runs out of memory is split
+# in halves and retried; on CPU the OS kills the process instead, so the
+# estimate errs on the large side.
+####################################################
+
+AUTO_MAX_BATCH = 16
+# Share of the free memory a batch may take
+AUTO_MEMORY_FRACTION = 0.7
+# Per-image estimate for encoders that are not ViTs (e.g. MobileSAM's TinyViT)
+DEFAULT_IMAGE_BYTES = 2**30
+
+# Peak activation bytes of encoding one image: 3 float32 heads x tokens^2
+# maps of a global attention block (scores, relative position terms,
+# softmax) and 4 tokens x MLP-width maps
+def encoder_bytes(encoder):
+    try:
+        tokens = (encoder.img_size // encoder.patch_embed.proj.kernel_size[0]) ** 2
+        heads = encoder.blocks[0].attn.num_heads
+        mlp = encoder.blocks[0].mlp.lin1.out_features
+    except AttributeError:
+        return DEFAULT_IMAGE_BYTES
+    return 4 * (3 * heads * tokens ** 2 + 4 * tokens * mlp)
+
+# Free bytes on the device: CUDA's free memory, or the kernel's MemAvailable
+# estimate for the CPU; None if unknown
+def free_memory(device):
+    import torch
+    device = torch.device(device)
+    if device.type == 'cuda':
+        return torch.cuda.mem_get_info(device)[0]
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def auto_batch_size(model, device, max_batch=AUTO_MAX_BATCH, fraction=AUTO_MEMORY_FRACTION):
+    per_image = encoder_bytes(model.image_encoder)
+    free = free_memory(device)
+    if free is None:
+        return 1
+    batch_size = int(max(1, min(max_batch, fraction * free // per_image)))
+    logger.info('encoder batch size %s: %.1f GB free, ~%.1f GB per image', batch_size, free / 2**30,
+                per_image / 2**30)
+    return batch_size
+
+####################################################
+# input: arrays
+#   HxWx3 uint8 images, as handed to predictor.set_image
+# output:
+#   [{'features': 1xCxhxw, 'original_size', 'input_size'}] per image
+####################################################
+def encode_batch(predictor, arrays):
+    if not arrays:
+        return []
+    import torch
+    model = predictor.model
+    images, sizes = [], []
+    for input_array in arrays:
+        # set_image's default image_format
+        image = input_array if model.image_format == 'RGB' else input_array[..., ::-1]
+        input_image = predictor.transform.apply_image(image)
+        input_image_torch = torch.as_tensor(input_image, device=predictor.device)
+        input_image_torch = input_image_torch.permute(2, 0, 1).contiguous()[None, :, :, :]
+        sizes.append((image.shape[:2], tuple(input_image_torch.shape[-2:])))
+        images.append(model.preprocess(input_image_torch))
+    with torch.no_grad():
+        features = model.image_encoder(torch.cat(images))
+    return [{'features': features[i:i+1], 'original_size': original_size, 'input_size': input_size}
+            for i, (original_size, input_size) in enumerate(sizes)]
+
+####################################################
+# Encoder of a stream of samples, batch_size images per forward pass
+#   With an embedding cache, hits are restored from it and only the misses
+#   are encoded (and put in the cache); every encoding then also has its
+#   cache 'key'. Each encoding carries 'seconds', its share of the time of
+#   its batch, for the encode stage of the timer.
+####################################################
+class BatchEncoder:
+    def __init__(self, predictor, batch_size=1, cache=None):
+        self.predictor = predictor
+        self.cache = cache
+        if batch_size == 0:
+            batch_size = auto_batch_size(predictor.model, predictor.device)
+        self.batch_size = batch_size
+
+    def _encode(self, arrays):
+        try:
+            return encode_batch(self.predictor, arrays)
+        except RuntimeError as e:
+            if 'out of memory' not in str(e) or len(arrays) == 1:
+                raise
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        half = len(arrays) // 2
+        self.batch_size = max(1, half)
+        logger.warning('encoder out of memory on %s images, batch size lowered to %s', len(arrays), self.batch_size)
+        return self._encode(arrays[:half]) + self._encode(arrays[half:])
+
+    def encode(self, arrays):
+        start = time.perf_counter()
+        encodings = [None] * len(arrays)
+        keys = [None] * len(arrays)
+        if self.cache is not None:
+            for i, input_array in enumerate(arrays):
+                keys[i] = self.cache.key(input_array)
+                encodings[i] = self.cache.get(keys[i])
+        todo = [i for i, encoding in enumerate(encodings) if encoding is None]
+        for i, encoding in zip(todo, self._encode([arrays[i] for i in todo])):
+            if self.cache is not None:
+                self.cache.put(keys[i], encoding['features'], encoding['original_size'], encoding['input_size'])
+            encodings[i] = encoding
+        seconds = (time.perf_counter() - start) / max(1, len(arrays))
+        for key, encoding in zip(keys, encodings):
+            encoding['seconds'] = seconds
+            if key is not None:
+                encoding['key'] = key
+        return encodings
+
+    # (mask_name, sample) pairs of prefetch_samples to (mask_name, sample,
+    # encoding), in order; samples that are None pass through unencoded
+    def iterate(self, samples):
+        pending, count = [], 0
+        for mask_name, sample in samples:
+            pending.append((mask_name, sample))
+            count += sample is not None
+            if count == self.batch_size:
+                yield from self._flush(pending)
+                pending, count = [], 0
+        yield from self._flush(pending)
+
+    def _flush(self, pending):
+        encodings = iter(self.encode([sample[2] for _, sample in pending if sample is not None]))
+        for mask_name, sample in pending:
+            yield mask_name, sample, (next(encodings) if sample is not None else None)
+
+# Samples of the per-image loop with their encodings, or None encodings
+# (set_image in the loop) without a BatchEncoder
+def encoded_samples(encoder, samples):
+    if encoder is None:
+        return ((mask_name, sample, None) for mask_name, sample in samples)
+    return encoder.iterate(samples)
@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from segment_anything import SamPredictor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from instrument import setup_logging
+from protocols import mode_protocol
+from sam_model import PRECISIONS, VARIANTS, load_sam, precision_error, resolve_checkpoint
+from synthetic import random_image, random_mask
+
+####################################################
+# Mask decoder calls and time of the v2 five-mode protocol per image,
+# with one predictor.predict call per box (before) and with the boxes of
+# modes 2-4 decoded in one batched pass (after).
+# The model is loaded as in the evaluation scripts (sam_model.load_sam).
+# Without --checkpoint or --model-path it is randomly initialised, which is
+# enough to count calls and time the decoder but not to compare IoU.
+####################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sam-variant", default="vit_b", choices=list(VARIANTS))
+    parser.add_argument("--model-path", default=None, type=str, help="directory of the checkpoints, looked up as in the evaluation scripts")
+    parser.add_argument("--checkpoint", default=None, type=str, help="checkpoint file; random weights if neither it nor --model-path is given")
+    parser.add_argument("--device", default=None, type=str, help="defaults to cuda if available, else cpu")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--threads", default=0, type=int, help="number of torch threads, 0 keeps torch's default")
+    parser.add_argument("--size", default=512, type=int)
+    parser.add_argument("--components", default="1,2,3,8", type=str)
+    parser.add_argument("--repeat", default=5, type=int)
+    args = parser.parse_args()
+    setup_logging('warning')
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    if precision_error(device, args.precision):
+        parser.error(precision_error(device, args.precision))
+    checkpoint = args.checkpoint
+    if args.model_path is not None:
+        checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+    sam = load_sam(checkpoint, device, args.precision, args.threads, args.sam_variant)
+    predictor = SamPredictor(sam)
+    calls = [0]
+    sam.mask_decoder.register_forward_hook(lambda *_: calls.__setitem__(0, calls[0] + 1))
+
+    print('components  batch_boxes  decoder_calls  ms/class   IoU')
+    for n in [int(c) for c in args.components.split(',')]:
+        mask = random_mask(args.size, n, seed=n)
+        predictor.set_image(random_image(mask, seed=n))
+        for batch_boxes in (False, True):
+            calls[0] = 0
+            np.random.seed(1)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                dc, _, _ = mode_protocol(predictor, mask, oracle=False, batch_boxes=batch_boxes)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print('%10d  %11s  %13d  %8.1f   %s' % (n, batch_boxes, calls[0] // args.repeat, elapsed * 1000,
+                                                   np.round(dc, 4)))
@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clicks import ClickSampler
+from protocols import center_point
+from synthetic import random_mask
+
+####################################################
+# Click generation of the v1 protocol for sequences of 1-20 clicks:
+# full-image protocols.center_point on the xor error mask (before) against
+# clicks.ClickSampler (after). The model is not run: the prediction after
+# click k is the GT grown or shrunk by a band that narrows with k, which
+# mimics SAM's errors concentrating along the object boundary.
+# Both versions are checked to produce the same clicks and RNG state.
+####################################################
+
+def simulated_preds(gt, num_clicks):
+    preds = []
+    for k in range(num_clicks):
+        width = max(1, 2 * (num_clicks - k))
+        kernel = np.ones((2 * width + 1, 2 * width + 1), np.uint8)
+        preds.append((cv2.dilate(gt, kernel) if k % 2 else cv2.erode(gt, kernel)) > 0)
+    return preds
+
+def clicks_before(gt, preds):
+    clicks = [center_point(gt)]
+    for pred in preds[:-1]:
+        clicks.append(center_point(np.uint8(np.bitwise_xor(gt, pred))))
+    return clicks
+
+def clicks_after(sampler, gt, preds):
+    clicks = [sampler.center_point(gt)]
+    for pred in preds[:-1]:
+        clicks.append(sampler.error_point(gt, pred))
+    return clicks
+
+def timed(fn, repeat):
+    np.random.seed(1)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        clicks = fn()
+    return (time.perf_counter() - start) / repeat, clicks, np.random.rand()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default=1024, type=int)
+    parser.add_argument("--components", default=3, type=int)
+    parser.add_argument("--clicks", default="1,2,5,10,20", type=str)
+    parser.add_argument("--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    gt = random_mask(args.size, args.components, seed=0, max_radius=args.size // 8)
+    sampler = ClickSampler(gt.shape)
+    print('object covers %.1f%% of the image' % (100 * gt.mean()))
+    print('clicks   before ms   after ms   speedup   same clicks')
+    for num_clicks in [int(c) for c in args.clicks.split(',')]:
+        preds = simulated_preds(gt, num_clicks)
+        t_before, c_before, r_before = timed(lambda: clicks_before(gt, preds), args.repeat)
+        t_after, c_after, r_after = timed(lambda: clicks_after(sampler, gt, preds), args.repeat)
+        same = c_before == c_after and r_before == r_after
+        print('%6d   %9.1f   %8.1f   %6.1fx   %s' % (num_clicks, t_before * 1000, t_after * 1000,
+                                                    t_before / t_after, same))
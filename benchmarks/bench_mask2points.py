@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from skimage.morphology import medial_axis
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eval_utils import Mask2Points, Mask2PointsFast, _skeleton_points
+from region_profile import RegionProfile
+from synthetic import random_mask
+
+####################################################
+# Skeleton point sampling: eval_utils.Mask2Points (full-size medial_axis +
+# KMeans, before) against Mask2PointsFast (bbox medial_axis + farthest-point
+# seeded k-means, after), on the first region as Mask2Points does.
+# Checked for every mask, with the same skeleton seed:
+#   skeleton: the bbox skeleton of every region equals the full-size one
+#   N=1: both select the same point
+#   N>1: the clusterings differ (KMeans is randomly initialised), so the
+#        k-means cost of the selected points on the skeleton is compared
+#        (after / before, lower is better)
+####################################################
+
+# Sum of squared distances of the skeleton points to the nearest selected point
+def selection_cost(mask, profiles):
+    profile = RegionProfile(mask)
+    region_id = next(i for i in range(1, profile.num+1) if profile.area(i) / mask.size >= 1e-4)
+    points = _skeleton_points(profile, [region_id])[region_id]
+    selected = profiles[0]['loc'][:, ::-1]
+    return ((points[:, None, :] - selected[None]) ** 2).sum(-1).min(1).sum()
+
+def same_skeletons(mask):
+    profile = RegionProfile(mask)
+    return all(np.array_equal(np.argwhere(medial_axis(profile.region_mask(i), rng=0)), _skeleton_points(profile, [i])[i])
+               for i in range(1, profile.num+1))
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="256,512,1024", type=str)
+    parser.add_argument("--components", default="1,3,8", type=str)
+    parser.add_argument("--points", default="1,3", type=str)
+    parser.add_argument("--repeat", default=3, type=int)
+    args = parser.parse_args()
+
+    print('  size  components  N   before ms   after ms   speedup   same skeleton   same points / cost ratio')
+    for size in [int(s) for s in args.sizes.split(',')]:
+        for n in [int(c) for c in args.components.split(',')]:
+            mask = random_mask(size, n, seed=n, max_radius=size // 4)
+            skeleton = same_skeletons(mask)
+            for N in [int(p) for p in args.points.split(',')]:
+                t_before, before = timed(lambda: Mask2Points(mask, N, seed=0), args.repeat)
+                t_after, after = timed(lambda: Mask2PointsFast(mask, N), args.repeat)
+                if N == 1:
+                    check = all(np.array_equal(a['loc'], b['loc']) and a['cls'] == b['cls']
+                                for a, b in zip(before, after)) and len(before) == len(after)
+                else:
+                    check = '%.3f' % (selection_cost(mask, after) / selection_cost(mask, before))
+                print('%6d  %10d  %d   %9.1f   %8.1f   %6.1fx   %13s   %s' % (size, n, N, t_before * 1000,
+                                                                            t_after * 1000, t_before / t_after,
+                                                                            skeleton, check))
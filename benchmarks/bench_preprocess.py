@@ -0,0 +1,105 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_utils import class_mask, load_sample
+from synthetic import random_image, random_mask
+
+####################################################
+# Peak memory of the per-image preprocessing: load_sample and the class
+# masks of protocols.evaluate_classes, before (float64 normalization of the
+# image and of 0/255 masks, int64 HxWxC one-hot mask, uint8 copy of each
+# class) and after (uint8 lookup table in place, bool label comparisons
+# viewed as uint8).
+# A synthetic grayscale image (maximum < 255, so it is rescaled) and its
+# mask are written as PNG files: a 0/255 mask for one class, labels
+# 1..classes otherwise. Peaks are measured with tracemalloc, which sees
+# numpy's buffers but not PIL's or OpenCV's own (the same in both paths).
+# Both paths are checked to give the same image and class masks.
+####################################################
+
+def load_sample_before(cfg, mask_name):
+    input_mask = cv2.imread(os.path.join(cfg['seg_dir'], mask_name), 0)
+    if np.max(input_mask) == 255:
+        input_mask = np.uint8(input_mask / input_mask.max())
+    input_array = np.array(Image.open(os.path.join(cfg['img_dir'], mask_name)).convert("RGB"))
+    input_array = np.uint8(input_array / np.max(input_array) * 255)
+    return input_mask, mask_name, input_array
+
+def class_masks_before(input_mask, num_class):
+    if num_class > 1:
+        mask_one_hot = (np.arange(1, num_class+1) == input_mask[...,None]).astype(int)
+    else:
+        mask_one_hot = np.array(input_mask > 0, dtype=int)[:,:,np.newaxis]
+    for cls in range(num_class):
+        yield np.uint8(mask_one_hot[:,:,cls])
+
+def class_masks_after(input_mask, num_class):
+    for cls in range(num_class):
+        yield class_mask(input_mask, num_class, cls)
+
+# Sample and class masks of one path; the masks are summed one at a time,
+# as the protocols use them
+def preprocess(load, class_masks, cfg, mask_name):
+    input_mask, _, input_array = load(cfg, mask_name)
+    areas = [int(np.count_nonzero(mask_cls)) for mask_cls in class_masks(input_mask, cfg['num_class'])]
+    return input_array, areas
+
+# (seconds, peak bytes, result) of fn(), the peak over its own allocations
+def measured(fn, repeat):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = fn()
+        seconds = (time.perf_counter() - start) / repeat
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return seconds, peak, result
+
+def write_sample(root, size, num_class, seed=0):
+    H, W = size
+    mask = np.zeros((H, W), np.uint8)
+    for cls in range(1, num_class+1):
+        mask[random_mask((H, W), 3, seed=seed + cls) > 0] = cls
+    image = random_image(mask, seed=seed)[:, :, 0]
+    if num_class == 1:
+        mask = mask * 255
+    cfg = {'name': 'synthetic', 'img_dir': root, 'seg_dir': os.path.join(root, 'masks'), 'num_class': num_class}
+    os.makedirs(cfg['seg_dir'], exist_ok=True)
+    Image.fromarray(image).save(os.path.join(cfg['img_dir'], 'sample.png'))
+    cv2.imwrite(os.path.join(cfg['seg_dir'], 'sample.png'), mask)
+    return cfg, 'sample.png'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1024x1024,4096x3328", type=str, help="comma separated HxW image sizes; 4096x3328 is a full-field mammogram")
+    parser.add_argument("--classes", default="1,3", type=str, help="comma separated class counts")
+    parser.add_argument("--repeat", default=3, type=int)
+    args = parser.parse_args()
+
+    print('       size  classes   before MB   after MB   reduction   before ms   after ms   same')
+    for size in args.sizes.split(','):
+        H, W = (int(s) for s in size.split('x'))
+        for num_class in [int(c) for c in args.classes.split(',')]:
+            with tempfile.TemporaryDirectory() as root:
+                cfg, mask_name = write_sample(root, (H, W), num_class)
+                t_before, m_before, before = measured(
+                    lambda: preprocess(load_sample_before, class_masks_before, cfg, mask_name), args.repeat)
+                t_after, m_after, after = measured(
+                    lambda: preprocess(load_sample, class_masks_after, cfg, mask_name), args.repeat)
+            same = np.array_equal(before[0], after[0]) and before[1] == after[1]
+            print('%11s  %7d   %9.1f   %8.1f   %8.1fx   %9.1f   %8.1f   %s' % (size, num_class, m_before / 2**20,
+                                                                             m_after / 2**20, m_before / m_after,
+                                                                             t_before * 1000, t_after * 1000, same))
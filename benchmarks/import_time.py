@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+####################################################
+# Import time of the entry points
+#   Every module is imported in a fresh interpreter under
+#   python -X importtime (after one untimed run that compiles the .pyc
+#   files), --repeat times; the time is the median cumulative import time.
+# Backends and feature-specific dependencies (LAZY) are imported on first
+# use: a module that loads one of them at import time is reported, and
+# makes the script exit with status 1 (tests/test_imports.py checks the
+# same in the test suite).
+# benchmarks/run_suite.py times the same imports with its other cases.
+####################################################
+
+MODULES = ['prompt_gen_and_exec_v1', 'prompt_gen_and_exec_v2_allmode', 'eval_volumes', 'encode_dataset',
+           'eval_from_embeddings', 'build_prompts', 'make_tables']
+
+LAZY = ['torch', 'segment_anything', 'mobile_sam', 'isegm', 'sklearn', 'matplotlib', 'shapely', 'nibabel', 'pydicom']
+
+_CODE = 'import sys, json; import %s; print(json.dumps([m for m in %r if m in sys.modules]))'
+
+# (cumulative us, name, depth) of every line of -X importtime
+def parse_importtime(stderr):
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        entries.append((int(cumulative), name.strip(), (len(name) - len(name.lstrip()) - 1) // 2))
+    return entries
+
+def import_once(module):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _CODE % (module, LAZY)], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    entries = parse_importtime(proc.stderr)
+    total = next(cumulative for cumulative, name, depth in entries if name == module and depth == 0)
+    return total / 1000, json.loads(proc.stdout.strip().splitlines()[-1]), entries
+
+####################################################
+# input: module
+#   name of a module of the repository
+# output:
+#   (median ms, LAZY modules loaded, [(ms, name)] of the heaviest direct
+#   imports of the last run)
+####################################################
+def measure(module, repeat=5, top=5):
+    import_once(module)
+    times = []
+    for _ in range(repeat):
+        ms, loaded, entries = import_once(module)
+        times.append(ms)
+    direct = sorted(((cumulative / 1000, name) for cumulative, name, depth in entries if depth == 1), reverse=True)
+    return float(np.median(times)), loaded, direct[:top]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", default=",".join(MODULES), type=str, help="comma separated modules to import")
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--top", default=5, type=int, help="number of the heaviest direct imports listed per module")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules.split(','):
+        try:
+            ms, loaded, direct = measure(module, args.repeat, args.top)
+        except RuntimeError as e:
+            # e.g. a dependency not installed here: keep going
+            print('%-35s     failed: %s' % (module, e))
+            continue
+        print('%-35s %10.1f ms%s' % (module, ms, '  EAGER: %s' % ', '.join(loaded) if loaded else ''))
+        for dep_ms, name in direct:
+            print('    %-31s %10.1f ms' % (name, dep_ms))
+        failed |= bool(loaded)
+    if failed:
+        sys.exit(1)
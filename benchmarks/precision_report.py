@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_utils import dataset_names, get_dataset_config, load_registry, load_sample
+from dataset_index import INDEX_DIR, load_index
+from protocols import mode_protocol_image
+from sam_model import PRECISIONS, VARIANTS, load_sam, precision_error, resolve_checkpoint
+from synthetic import random_image, random_mask
+
+####################################################
+# Encoder latency and accuracy of the SAM precisions (sam_model.PRECISIONS)
+#   A fixed sample of --num-images masks per dataset (evenly spaced over the
+#   masks of its index) is encoded by every --precisions x --threads
+#   setting and scored with the v2 five-mode protocol. Reported per dataset
+#   and setting: median encoder (set_image) latency, mean IoU, and the mean
+#   and max absolute IoU difference to fp32 with the same prompts.
+# Without --checkpoint or --model-path the model is randomly initialised and without
+# --dataset the images are synthetic: enough for the latencies, not for the
+# IoU comparison.
+####################################################
+
+def sample_masks(mask_list, num_images):
+    step = max(1, len(mask_list) // num_images)
+    return mask_list[::step][:num_images]
+
+# [(dataset, num_class, [(input_mask, input_array)])]
+def load_samples(args):
+    if args.dataset is None:
+        samples = []
+        for n in range(args.num_images):
+            mask = random_mask(args.size, n % 4 + 1, seed=n)
+            samples.append((mask, random_image(mask, seed=n)))
+        return [('synthetic', 1, samples)]
+    registry = load_registry(args.registry)
+    datasets = []
+    for dataset in dataset_names(args.dataset, registry):
+        cfg = get_dataset_config(dataset, args.init_path, registry)
+        samples = []
+        for mask_name in sample_masks(load_index(cfg, args.index_dir).masks(), args.num_images):
+            sample = load_sample(cfg, mask_name)
+            if sample is not None:
+                samples.append((sample[0], sample[2]))
+        datasets.append((dataset, cfg['num_class'], samples))
+    return datasets
+
+# (encoder ms per image, v2 IoU per image) of one setting
+def run(predictor, samples, num_class):
+    times, scores = [], []
+    for input_mask, input_array in samples:
+        start = time.perf_counter()
+        predictor.set_image(input_array)
+        times.append(time.perf_counter() - start)
+        np.random.seed(1)
+        dc, _ = mode_protocol_image(predictor, input_mask, num_class, False)
+        scores.append(np.array(dc, dtype=float))
+    return 1000 * np.array(times), scores
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sam-variant", default="vit_h", choices=list(VARIANTS))
+    parser.add_argument("--model-path", default=None, type=str, help="directory of the checkpoints, looked up as in the evaluation scripts")
+    parser.add_argument("--checkpoint", default=None, type=str, help="checkpoint file; random weights if neither it nor --model-path is given")
+    parser.add_argument("--dataset", default=None, type=str, help="datasets of the registry, a comma separated list, or all; synthetic data if not given")
+    parser.add_argument("--init-path", default="./", type=str)
+    parser.add_argument("--registry", default=None, type=str, help="dataset registry file, defaults to datasets.json")
+    parser.add_argument("--index-dir", default=INDEX_DIR, type=str, help="directory of the cached dataset indexes")
+    parser.add_argument("--num-images", default=10, type=int, help="number of images per dataset")
+    parser.add_argument("--size", default=1024, type=int, help="size of the synthetic images")
+    parser.add_argument("--device", default="cpu", type=str)
+    parser.add_argument("--precisions", default=",".join(PRECISIONS), type=str, help="comma separated precisions, fp32 is always run as the reference")
+    parser.add_argument("--threads", default="0", type=str, help="comma separated torch thread counts, 0 keeps torch's default")
+    parser.add_argument("--save", default=None, type=str, help="JSON file to save the report to")
+    args = parser.parse_args()
+
+    import torch
+    from segment_anything import SamPredictor
+    precisions = ['fp32'] + [p for p in args.precisions.split(',') if p != 'fp32']
+    for precision in precisions:
+        if precision not in PRECISIONS:
+            parser.error('unknown precision %r, choose among: %s' % (precision, ', '.join(PRECISIONS)))
+        if precision_error(args.device, precision):
+            parser.error(precision_error(args.device, precision))
+    # 0: the default count of this machine, restored between settings
+    threads = [int(t) or torch.get_num_threads() for t in args.threads.split(',')]
+    checkpoint = args.checkpoint
+    if args.model_path is not None:
+        checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+
+    datasets = load_samples(args)
+    report = []
+    reference = {}
+    for precision in precisions:
+        for num_threads in threads:
+            # Same weights in every setting when they are random
+            torch.manual_seed(0)
+            sam = load_sam(checkpoint, args.device, precision, num_threads, args.sam_variant)
+            predictor = SamPredictor(sam)
+            for dataset, num_class, samples in datasets:
+                times, scores = run(predictor, samples, num_class)
+                if precision == 'fp32':
+                    reference.setdefault(dataset, scores)
+                diff = np.abs(np.concatenate([s.ravel() for s in scores]) -
+                              np.concatenate([s.ravel() for s in reference[dataset]]))
+                report.append({'dataset': dataset, 'precision': precision, 'threads': num_threads,
+                               'images': len(samples), 'encoder_ms': float(np.median(times)),
+                               'mean_iou': float(np.nanmean(np.concatenate([s.ravel() for s in scores]))),
+                               'mean_abs_diou': float(np.nanmean(diff)), 'max_abs_diou': float(np.nanmax(diff))})
+            del predictor, sam
+
+    print('%-20s %9s %7s %6s %10s %8s %11s %10s' % ('dataset', 'precision', 'threads', 'images', 'encoder ms',
+                                                  'mean IoU', 'mean |dIoU|', 'max |dIoU|'))
+    for row in report:
+        print('%-20s %9s %7s %6d %10.1f %8.4f %11.4f %10.4f' % (row['dataset'], row['precision'], row['threads'],
+                                                               row['images'], row['encoder_ms'], row['mean_iou'],
+                                                               row['mean_abs_diou'], row['max_abs_diou']))
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump({'device': args.device, 'sam_variant': args.sam_variant, 'checkpoint': checkpoint,
+                       'report': report}, f, indent=1)
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from clicks import ClickSampler
+from eval_utils import IOU, IOUMulti, MaskToBoxSimple, MaskToBoxes, Mask2Points, Mask2PointsFast
+from import_time import MODULES, measure
+from metrics import iou_stack
+from predictors import FakePredictor, SamPredictorAdapter
+from protocols import center_point, click_protocol_image, mode_protocol_image
+from stub_sam import StubSamPredictor
+from synthetic import random_image, random_mask
+
+####################################################
+# Benchmark suite of the prompt generation and scoring hot paths
+#   Every case runs on synthetic masks of each --sizes x --components and is
+#   timed over --repeat runs (median ms per call, the RNG reseeded before
+#   each run). No model is needed: the v1 loop runs on predictors.FakePredictor
+#   and, like the v2 loop, on benchmarks/stub_sam.StubSamPredictor, which
+#   keeps the real decode/upscale/scoring path without the networks.
+# The cumulative import time of the entry points (benchmarks/import_time)
+# is tracked alongside, as the 'import <module>' cases.
+# Results are saved as JSON (default benchmarks/results/<git rev>.json);
+# --compare BASELINE.json prints the change against a previous run and
+# exits with status 1 if a case got slower by more than --tolerance.
+####################################################
+
+CASES = {}
+
+# A case is set up once per mask outside the timing: fn(mask, image) returns
+# the callable to time
+def case(name):
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+# Prediction with errors along the object boundary
+def noisy_pred(mask):
+    return cv2.dilate(mask, np.ones((5, 5), np.uint8)) > 0
+
+@case('MaskToBoxSimple')
+def _(mask, image):
+    return lambda: MaskToBoxSimple(mask)
+
+@case('MaskToBoxes')
+def _(mask, image):
+    return lambda: MaskToBoxes(mask)
+
+@case('Mask2Points')
+def _(mask, image):
+    return lambda: Mask2Points(mask, N=1)
+
+@case('Mask2PointsFast')
+def _(mask, image):
+    return lambda: Mask2PointsFast(mask, N=1)
+
+@case('Mask2PointsFast (all regions)')
+def _(mask, image):
+    return lambda: Mask2PointsFast(mask, N=3, all_regions=True)
+
+@case('center_point')
+def _(mask, image):
+    return lambda: center_point(mask)
+
+@case('ClickSampler.center_point')
+def _(mask, image):
+    sampler = ClickSampler(mask.shape)
+    return lambda: sampler.center_point(mask)
+
+@case('IOU')
+def _(mask, image):
+    pred = np.uint8(noisy_pred(mask))
+    return lambda: IOU(pred, mask)
+
+@case('IOUMulti')
+def _(mask, image):
+    # Up to 3 classes: components labelled 1, 2, 3, 1, ...
+    _, labels = cv2.connectedComponents(mask)
+    y = np.uint8(np.where(labels > 0, (labels - 1) % 3 + 1, 0))
+    pred = np.where(noisy_pred(mask), y.max(), 0).astype(np.uint8)
+    return lambda: IOUMulti(pred, y)
+
+@case('iou_stack')
+def _(mask, image):
+    preds = np.stack([mask > 0, noisy_pred(mask), np.zeros(mask.shape, bool)])
+    return lambda: iou_stack(preds, mask)
+
+@case('v1 loop (FakePredictor)')
+def _(mask, image):
+    predictor = FakePredictor()
+    predictor.set_image(image)
+    return lambda: click_protocol_image(predictor, image, mask, 1, 5, True)
+
+@case('v1 loop (stub SAM)')
+def _(mask, image):
+    predictor = SamPredictorAdapter(StubSamPredictor())
+    predictor.set_image(image)
+    return lambda: click_protocol_image(predictor, image, mask, 1, 5, True)
+
+@case('v2 loop (stub SAM)')
+def _(mask, image):
+    predictor = StubSamPredictor()
+    predictor.set_image(image)
+    return lambda: mode_protocol_image(predictor, mask, 1, True)
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        np.random.seed(1)
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+def git_rev():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run(names, sizes, components, repeat):
+    results = {}
+    for size in sizes:
+        for n in components:
+            mask = random_mask(size, n, seed=n)
+            image = random_image(mask, seed=n)
+            for name in names:
+                key = '%s/%d/%d' % (name, size, n)
+                try:
+                    results[key] = timed(CASES[name](mask, image), repeat)
+                except Exception as e:
+                    # e.g. a dependency version the code does not support: keep going
+                    results[key] = None
+                    print('%-45s     failed: %s: %s' % (key, type(e).__name__, e))
+                    continue
+                print('%-45s %10.3f ms' % (key, results[key]))
+    return results
+
+def run_imports(modules, repeat):
+    results = {}
+    for module in modules:
+        key = 'import %s' % module
+        try:
+            results[key] = measure(module, repeat)[0]
+        except RuntimeError as e:
+            results[key] = None
+            print('%-45s     failed: %s' % (key, e))
+            continue
+        print('%-45s %10.3f ms' % (key, results[key]))
+    return results
+
+# Change of every case present in both runs; returns the slower ones
+def compare(baseline, results, tolerance):
+    regressions = []
+    print('%-45s %10s %10s %7s' % ('case/size/components', 'before ms', 'after ms', 'ratio'))
+    for key, after in results.items():
+        if after is None or baseline.get(key) is None:
+            continue
+        before = baseline[key]
+        ratio = after / before if before > 0 else float('inf')
+        slower = ratio > 1 + tolerance
+        if slower:
+            regressions.append(key)
+        print('%-45s %10.3f %10.3f %6.2fx%s' % (key, before, after, ratio, '  SLOWER' if slower else ''))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", default=None, type=str, help="comma separated case names, all if not given")
+    parser.add_argument("--sizes", default="256,512,1024", type=str)
+    parser.add_argument("--components", default="1,3,8", type=str)
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--imports", default=",".join(MODULES), type=str, help="comma separated modules whose import is timed, empty for none")
+    parser.add_argument("--save", default=None, type=str, help="result file, defaults to benchmarks/results/<git rev>.json")
+    parser.add_argument("--compare", default=None, type=str, help="result file of a previous run to compare against")
+    parser.add_argument("--tolerance", default=0.2, type=float, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    names = list(CASES) if args.cases is None else args.cases.split(',')
+    for name in names:
+        if name not in CASES:
+            parser.error('unknown case %r, choose among: %s' % (name, ', '.join(CASES)))
+    results = run(names, [int(s) for s in args.sizes.split(',')], [int(c) for c in args.components.split(',')],
+                  args.repeat)
+    results.update(run_imports([m for m in args.imports.split(',') if m], args.repeat))
+
+    rev = git_rev()
+    save = args.save or os.path.join(ROOT, 'benchmarks', 'results', '%s.json' % rev)
+    os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+    with open(save, 'w') as f:
+        json.dump({'rev': rev, 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                   'numpy': np.__version__, 'machine': platform.machine(), 'repeat': args.repeat,
+                   'results': results}, f, indent=1)
+    print('saved', save)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print('compared to %s (%s)' % (args.compare, baseline['rev']))
+        if compare(baseline['results'], results, args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,125 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+from segment_anything import SamPredictor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_utils import get_dataset_config, list_masks, load_sample
+from instrument import setup_logging
+from predictors import SamPredictorAdapter
+from protocols import click_protocol_image, mode_protocol_image
+from sam_model import PRECISIONS, VARIANTS, load_sam, precision_error, resolve_checkpoint
+from synthetic import random_image, random_mask
+
+####################################################
+# Accuracy vs speed of the reduced-resolution oracle selection (--score-res)
+#   Every image is encoded once, then scored in oracle mode with the v2
+#   five-mode protocol and the v1 click protocol at full resolution
+#   (score_res=0) and at each --score-res. Reported per setting: decoding +
+#   scoring time per image (encoder excluded), mean IoU, and the mean / max
+#   absolute IoU difference to the full-resolution path.
+#   As a yardstick, the mean gain of the oracle over the default output in
+#   experimental_results_tables/ (Fig. 2, full-resolution oracle) is printed:
+#   the difference to the full-resolution path should be far below it.
+# The model is loaded as in the evaluation scripts (sam_model.load_sam:
+# --sam-variant, --precision, --device). Without --checkpoint or
+# --model-path it is randomly initialised and without --dataset the images
+# are synthetic: enough for the timings, not for the IoU comparison.
+####################################################
+
+TABLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                     'experimental_results_tables', 'Fig2-Performance of SAM for 5 modes of Use.csv')
+
+def oracle_gain(table=TABLE):
+    gains = []
+    with open(table) as f:
+        rows = list(csv.reader(f))
+    header = rows[0]
+    for row in rows[1:]:
+        for i, name in enumerate(header):
+            if '(oracle)' in name:
+                default = header.index(name.replace(' (oracle)', ''))
+                gains.append(float(row[i]) - float(row[default]))
+    return np.mean(gains)
+
+def samples(args):
+    if args.dataset is None:
+        for n in range(args.max_images):
+            mask = random_mask(args.size, n % 4 + 1, seed=n)
+            yield mask, random_image(mask, seed=n), 1
+        return
+    cfg = get_dataset_config(args.dataset, args.init_path)
+    count = 0
+    for mask_name in list_masks(cfg):
+        sample = load_sample(cfg, mask_name)
+        if sample is None:
+            continue
+        input_mask, _, input_array = sample
+        yield input_mask, input_array, cfg['num_class']
+        count += 1
+        if count == args.max_images:
+            return
+
+def run(protocol, predictor, input_mask, num_class, score_res, num_prompt):
+    np.random.seed(1)
+    start = time.perf_counter()
+    if protocol == 'v2':
+        dc, _ = mode_protocol_image(predictor, input_mask, num_class, True, score_res=score_res)
+    else:
+        dc, _ = click_protocol_image(SamPredictorAdapter(predictor, score_res=score_res), None, input_mask,
+                                     num_class, num_prompt, True)
+    return time.perf_counter() - start, np.array(dc, dtype=float)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sam-variant", default="vit_b", choices=list(VARIANTS))
+    parser.add_argument("--model-path", default=None, type=str, help="directory of the checkpoints, looked up as in the evaluation scripts")
+    parser.add_argument("--checkpoint", default=None, type=str, help="checkpoint file; random weights if neither it nor --model-path is given")
+    parser.add_argument("--device", default=None, type=str, help="defaults to cuda if available, else cpu")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS)
+    parser.add_argument("--threads", default=0, type=int, help="number of torch threads, 0 keeps torch's default")
+    parser.add_argument("--dataset", default=None, type=str, help="dataset name, synthetic data if not given")
+    parser.add_argument("--init-path", default="./", type=str)
+    parser.add_argument("--max-images", default=10, type=int)
+    parser.add_argument("--size", default=1024, type=int, help="size of the synthetic images")
+    parser.add_argument("--num-prompt", default=5, type=int)
+    parser.add_argument("--score-res", default="256,512", type=str)
+    args = parser.parse_args()
+    # Only skipped samples are logged, not every image and mode
+    setup_logging('warning')
+
+    device = args.device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    if precision_error(device, args.precision):
+        parser.error(precision_error(device, args.precision))
+    checkpoint = args.checkpoint
+    if args.model_path is not None:
+        checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+    sam = load_sam(checkpoint, device, args.precision, args.threads, args.sam_variant)
+    predictor = SamPredictor(sam)
+    settings = [0] + [int(r) for r in args.score_res.split(',')]
+
+    times = {(p, r): [] for p in ('v2', 'v1') for r in settings}
+    scores = {(p, r): [] for p in ('v2', 'v1') for r in settings}
+    for input_mask, input_array, num_class in samples(args):
+        predictor.set_image(input_array)
+        for protocol in ('v2', 'v1'):
+            for score_res in settings:
+                elapsed, dc = run(protocol, predictor, input_mask, num_class, score_res, args.num_prompt)
+                times[protocol, score_res].append(elapsed)
+                scores[protocol, score_res].append(dc)
+
+    print('mean oracle gain in %s: %.4f' % (os.path.basename(TABLE), oracle_gain()))
+    print('protocol  score_res  ms/image  mean IoU  mean |dIoU|  max |dIoU|')
+    for protocol in ('v2', 'v1'):
+        full = np.concatenate([dc.ravel() for dc in scores[protocol, 0]])
+        for score_res in settings:
+            dc = np.concatenate([dc.ravel() for dc in scores[protocol, score_res]])
+            diff = np.abs(dc - full)
+            print('%8s  %9s  %8.1f  %8.4f  %11.4f  %10.4f' % (protocol, score_res or 'full',
+                                                             1000 * np.mean(times[protocol, score_res]),
+                                                             np.nanmean(dc), np.nanmean(diff), np.nanmax(diff)))
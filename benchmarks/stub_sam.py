@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+####################################################
+# Stand-in for segment_anything's SamPredictor, with the attributes that
+# sam_decode and the protocols use, so that full v1/v2 loops can be timed
+# without SAM weights or a GPU.
+#   Prompts are resized to the 1024 input frame like ResizeLongestSide, and
+#   the "mask decoder" draws the prompts on the 256x256 low-res grid as 3
+#   outputs of growing size (discs around clicks, shrunk/grown boxes).
+#   Upscaling is SAM's postprocess_masks, so decode/upscale/scoring costs
+#   are those of the real pipeline minus the networks.
+####################################################
+
+IMG_SIZE = 1024
+LOW_RES = 256
+
+class _ResizeLongestSide:
+    def __init__(self, target_length):
+        self.target_length = target_length
+
+    def _new_size(self, original_size):
+        scale = self.target_length / max(original_size)
+        return tuple(int(s * scale + 0.5) for s in original_size)
+
+    def apply_coords(self, coords, original_size):
+        new_h, new_w = self._new_size(original_size)
+        coords = np.array(coords, dtype=float)
+        coords[..., 0] *= new_w / original_size[1]
+        coords[..., 1] *= new_h / original_size[0]
+        return coords
+
+    def apply_boxes(self, boxes, original_size):
+        return self.apply_coords(boxes.reshape(-1, 2, 2), original_size).reshape(-1, 4)
+
+class _PromptEncoder:
+    # The "embeddings" are the prompts themselves, drawn by the decoder
+    def __call__(self, points=None, boxes=None, masks=None):
+        return (points, boxes), None
+
+    def get_dense_pe(self):
+        return None
+
+class _MaskDecoder:
+    def __init__(self, radii=(2, 4, 8), margins=(-2, 0, 2)):
+        self.radii = radii
+        self.margins = margins
+
+    def __call__(self, image_embeddings, image_pe, sparse_prompt_embeddings, dense_prompt_embeddings,
+                 multimask_output=True):
+        points, boxes = sparse_prompt_embeddings
+        scale = LOW_RES / IMG_SIZE
+        outputs = []
+        if boxes is not None:
+            for box in boxes.cpu().numpy() * scale:
+                out = np.full((3, LOW_RES, LOW_RES), -4, dtype=np.float32)
+                for k, m in enumerate(self.margins):
+                    x0, y0, x1, y1 = [int(round(v)) for v in box + np.array([-m, -m, m, m])]
+                    cv2.rectangle(out[k], (x0, y0), (x1, y1), 4, -1)
+                outputs.append(out)
+        else:
+            coords, labels = points[0][0].cpu().numpy() * scale, points[1][0].cpu().numpy()
+            out = np.full((3, LOW_RES, LOW_RES), -4, dtype=np.float32)
+            for k, radius in enumerate(self.radii):
+                for (x, y), label in zip(coords, labels):
+                    cv2.circle(out[k], (int(x), int(y)), radius, 4 if label else -4, -1)
+            outputs.append(out)
+        low_res = torch.from_numpy(np.stack(outputs))
+        if not multimask_output:
+            low_res = low_res[:, :1]
+        return low_res, torch.ones(low_res.shape[:2])
+
+class _ImageEncoder:
+    img_size = IMG_SIZE
+
+class _StubSam:
+    mask_threshold = 0.0
+
+    def __init__(self):
+        self.image_encoder = _ImageEncoder()
+        self.prompt_encoder = _PromptEncoder()
+        self.mask_decoder = _MaskDecoder()
+
+    # Same as Sam.postprocess_masks
+    def postprocess_masks(self, masks, input_size, original_size):
+        masks = F.interpolate(masks, (IMG_SIZE, IMG_SIZE), mode='bilinear', align_corners=False)
+        masks = masks[..., :input_size[0], :input_size[1]]
+        return F.interpolate(masks, tuple(original_size), mode='bilinear', align_corners=False)
+
+class StubSamPredictor:
+    def __init__(self):
+        self.model = _StubSam()
+        self.transform = _ResizeLongestSide(IMG_SIZE)
+        self.device = torch.device('cpu')
+        self.features = None
+        self.original_size = None
+        self.input_size = None
+
+    def set_image(self, image):
+        self.original_size = image.shape[:2]
+        self.input_size = self.transform._new_size(self.original_size)
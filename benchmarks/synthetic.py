@@ -0,0 +1,25 @@
+import cv2
+import numpy as np
+
+# Synthetic inputs shared by the benchmarks
+
+# Binary uint8 mask with n_components disjoint-ish blobs (ellipses)
+def random_mask(size, n_components, seed=0, max_radius=None):
+    rng = np.random.RandomState(seed)
+    H, W = (size, size) if np.isscalar(size) else size
+    if max_radius is None:
+        max_radius = max(4, min(H, W) // (4 * int(np.sqrt(n_components)) + 4))
+    mask = np.zeros((H, W), np.uint8)
+    for _ in range(n_components):
+        center = (int(rng.randint(0, W)), int(rng.randint(0, H)))
+        axes = (int(rng.randint(2, max_radius + 1)), int(rng.randint(2, max_radius + 1)))
+        cv2.ellipse(mask, center, axes, float(rng.randint(0, 180)), 0, 360, 1, -1)
+    return mask
+
+# uint8 RGB image loosely correlated with the mask
+def random_image(mask, seed=0):
+    rng = np.random.RandomState(seed)
+    img = rng.randint(0, 120, mask.shape, dtype=np.uint8)
+    img[mask > 0] += 100
+    img = cv2.GaussianBlur(img, (7, 7), 0)
+    return np.repeat(img[:, :, None], 3, axis=2)
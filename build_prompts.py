@@ -0,0 +1,45 @@
+import argparse
+import json
+import logging
+import os
+
+from data_utils import dataset_names, get_dataset_config, load_registry
+from dataset_index import INDEX_DIR, load_index
+from prompt_index import build_prompts, prompt_path
+from instrument import LOG_LEVELS, setup_logging, timer
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Generate the prompts of the v1 (first click) or v2 (5 modes) protocol for
+# every mask of the datasets, without any model, and save them to --out as
+# <protocol>_prompts_<dataset>.npz (see prompt_index). Replay them with
+#   prompt_gen_and_exec_v1.py / prompt_gen_and_exec_v2_allmode.py --prompts <out>
+# with the same --dataset list.
+####################################################
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the prompts of a protocol")
+    parser.add_argument("--protocol", default="v2", choices=["v1", "v2"], help="v1: first click of each class, v2: the 5 modes")
+    parser.add_argument("--init-path", default="./", type=str, help="the path of the dataset")
+    parser.add_argument("--dataset", default="all", type=str, help="dataset of the registry, a comma separated list, or all")
+    parser.add_argument("--registry", default=None, type=str, help="dataset registry file, defaults to datasets.json")
+    parser.add_argument("--index-dir", default=INDEX_DIR, type=str, help="directory of the cached dataset indexes")
+    parser.add_argument("--rebuild-index", action="store_true", help="re-read every mask instead of using the cached dataset index")
+    parser.add_argument("--out", default="./prompts", type=str, help="directory to save the prompts in")
+    parser.add_argument("--prefetch", default=4, type=int, help="number of masks read ahead, 0 reads them synchronously")
+    parser.add_argument("--io-threads", default=2, type=int, help="number of threads reading masks ahead")
+    parser.add_argument("--log-level", default="info", choices=LOG_LEVELS, help="debug also logs every mask and class")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    os.makedirs(args.out, exist_ok=True)
+    registry = load_registry(args.registry)
+    for dataset in dataset_names(args.dataset, registry):
+        cfg = get_dataset_config(dataset, args.init_path, registry)
+        mask_list = load_index(cfg, args.index_dir, args.rebuild_index, args.io_threads).masks()
+        timer.reset()
+        index = build_prompts(cfg, mask_list, args.protocol, args.prefetch, args.io_threads)
+        index.save(prompt_path(args.out, args.protocol, dataset))
+        logger.info('%s: %s prompt rows for %s masks', dataset, len(index.columns['mask']), len(index))
+        logger.info('timing %s %s', dataset, json.dumps(timer.summary()))
@@ -0,0 +1,52 @@
+import cv2
+import numpy as np
+
+####################################################
+# Click generation for the v1 iterative protocol
+#   Same clicks as protocols.center_point (including the random draw among
+#   equally distant pixels, so the global RNG stream is unchanged), but the
+#   distance transform and the argmax only run on the bounding box of the
+#   mask plus a 1 pixel border. The border is background, so no pixel
+#   outside it can be the closest background pixel of a pixel inside the
+#   box, and the distances and the order of the candidates are the same as
+#   on the full padded image.
+#   The error mask and the padded/distance buffers are allocated once per
+#   image size and reused for every click and class.
+####################################################
+class ClickSampler:
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        h, w = self.shape
+        self._error = np.empty(self.shape, dtype=bool)
+        # Flat buffers, viewed as contiguous (crop_h+2)x(crop_w+2) images
+        self._padded = np.empty((h + 2) * (w + 2), dtype=np.uint8)
+        self._dist = np.empty((h + 2) * (w + 2), dtype=np.float32)
+
+    # Point farthest from the boundary of a binary mask, ties broken at random
+    def center_point(self, binary_msk):
+        rows = np.flatnonzero(binary_msk.any(axis=1))
+        if len(rows) == 0:
+            # Nothing to click on: every pixel is at distance 0, draw among all of them
+            random_idx = np.random.randint(0, binary_msk.size)
+            cY, cX = divmod(random_idx, self.shape[1])
+            return int(cX), int(cY)
+        cols = np.flatnonzero(binary_msk.any(axis=0))
+        y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+        size = (y1 - y0 + 2) * (x1 - x0 + 2)
+        padded = self._padded[:size].reshape(y1 - y0 + 2, x1 - x0 + 2)
+        padded[0] = padded[-1] = 0
+        padded[:, 0] = padded[:, -1] = 0
+        padded[1:-1, 1:-1] = binary_msk[y0:y1, x0:x1]
+        dist = self._dist[:size].reshape(padded.shape)
+        dist = cv2.distanceTransform(padded, distanceType=cv2.DIST_L2, maskSize=5, dst=dist)
+
+        dist_img = dist[1:-1, 1:-1]
+        cY, cX = np.where(dist_img == dist_img.max())
+        random_idx = np.random.randint(0, len(cX))
+        return int(cX[random_idx]) + x0, int(cY[random_idx]) + y0
+
+    # Next click: center of the region where the prediction disagrees with the GT
+    def error_point(self, mask_cls, pred_mask):
+        np.not_equal(mask_cls, pred_mask, out=self._error)
+        return self.center_point(self._error)
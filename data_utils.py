@@ -0,0 +1,174 @@
+from PIL import Image
+
+import os
+import cv2
+import json
+import logging
+import numpy as np
+
+from results import save_results
+from volume_io import is_nifti, list_slices, read_image_slice, read_mask_slice, split_slice_name
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Dataset registry: datasets.json next to this file, or another file of the
+# same layout given with --registry. Every entry may set
+#   root         dataset directory, relative to the init path ({name} is
+#                replaced by the dataset name)
+#   images/masks image and mask directories inside root
+#   num_class    number of classes, labelled 1..num_class in the masks
+#   mask_filter  only masks whose name contains it (GMSC: all masks share
+#                one directory)
+#   image_name   [old, new] replacements turning a mask name into the name
+#                of its image, applied in order
+#   label_map    {"label in the file": class} remapped on load (BraTS 1,2,4)
+#   labels       names of the classes in the result tables (results.py)
+#   window, volume_pattern   see volume_io and volumes
+# and takes the "defaults" for the rest. Names missing from the registry use
+# the defaults alone, i.e. <init path>/sa_<name>/{images,masks}, one class.
+####################################################
+REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datasets.json')
+
+def load_registry(path=None):
+    with open(path or REGISTRY_PATH) as f:
+        return json.load(f)
+
+# Names of 'all', in registry order
+DATASET_LIST = list(load_registry()['datasets'])
+
+# --dataset: one name, a comma separated list, or all
+def dataset_names(arg, registry=None):
+    if arg == 'all':
+        return list((registry or load_registry())['datasets'])
+    return arg.split(',')
+
+####################################################
+# input: dataset
+#   Dataset name, an entry of the registry
+# input: registry
+#   Loaded registry, defaults to datasets.json
+# output:
+#   {'name', 'img_dir', 'seg_dir', 'num_class', 'mask_filter', 'image_name',
+#    'label_map'} plus the optional keys the entry sets
+####################################################
+def get_dataset_config(dataset, init_path, registry=None):
+    if registry is None:
+        registry = load_registry()
+    entry = dict(registry['defaults'])
+    entry.update(registry['datasets'].get(dataset, {}))
+
+    root = os.path.join(init_path, entry.pop('root').format(name=dataset))
+    cfg = {'name': dataset, 'img_dir': os.path.join(root, entry.pop('images')),
+           'seg_dir': os.path.join(root, entry.pop('masks')), 'num_class': entry.pop('num_class'),
+           'mask_filter': entry.pop('mask_filter', None), 'image_name': entry.pop('image_name', []),
+           'label_map': entry.pop('label_map', {})}
+    cfg.update(entry)
+    return cfg
+
+# Mask file names to evaluate, in os.listdir order. A NIfTI mask volume
+# stands for all its slices, named '<file>:<slice>' (see volume_io)
+def list_masks(cfg, im_list=None):
+    mask_list = []
+    for im_name in os.listdir(cfg['seg_dir']):
+        # Skip non-selected images if specified
+        if im_list is not None and im_name not in im_list:
+            continue
+        # GMSC: All masks in the same dir, separated by names
+        if cfg.get('mask_filter') and cfg['mask_filter'] not in im_name:
+            continue
+        if 'DS_Store' in im_name:
+            continue
+        if is_nifti(im_name):
+            mask_list += list_slices(cfg['seg_dir'], im_name)
+            continue
+        mask_list.append(im_name)
+    return mask_list
+
+####################################################
+# input: mask_name
+#   File name inside cfg['seg_dir']
+# output:
+#   (input_mask, im_name), or None if the mask is unreadable or empty
+#   input_mask is uint8 labelled 0,1,2,...; im_name is the matching image name
+####################################################
+def load_mask(cfg, mask_name, keep_empty=False):
+    if split_slice_name(mask_name) is not None:
+        # Slice of a NIfTI volume: only that slice is read, and its image has the same name
+        input_mask = read_mask_slice(cfg, mask_name)
+    else:
+        input_mask = cv2.imread(os.path.join(cfg['seg_dir'], mask_name), 0)
+    if input_mask is None:
+        logger.warning('Cannot read mask %s', mask_name)
+        return None
+
+    if np.max(input_mask) == 0 and not keep_empty:
+        logger.debug('Empty mask %s', mask_name)
+        return None
+
+    # In multi-class setting, we assume classes are labeled 0,1,2,3...
+    # BraTS has label 1,2,4: remapped by the registry's label_map
+    for label, cls in cfg.get('label_map', {}).items():
+        input_mask[input_mask == int(label)] = cls
+
+    # In binary-class setting, some masks are encoded as 0, 255
+    if np.max(input_mask) == 255:
+        input_mask = (input_mask == 255).view(np.uint8)
+
+    # Chest and GMSC: name inconsistentcy, fixed by the registry's image_name
+    im_name = mask_name
+    for old, new in cfg.get('image_name', []):
+        im_name = im_name.replace(old, new)
+    return input_mask, im_name
+
+# Read an image as normalized uint8 RGB, or None if unreadable.
+# Volume slices are windowed instead (volume_io.read_image_slice)
+def load_image(cfg, im_name):
+    if split_slice_name(im_name) is not None:
+        return read_image_slice(cfg, im_name)
+    try:
+        input_image = Image.open(os.path.join(cfg['img_dir'], im_name)).convert("RGB")
+    except:
+        logger.warning('Cannot read image %s', im_name)
+        return None
+
+    return stretch_uint8(np.array(input_image))
+
+# Rescale a uint8 image in place so that its maximum is 255. The 256 levels
+# go through np.uint8(x / max * 255) in float64, as the whole image used to,
+# and the image through that lookup table: same bytes, no float64 copy of
+# the image (8x its size, ~300 MB for a 4k RGB mammogram)
+def stretch_uint8(input_array):
+    lut = np.uint8(np.arange(256) / np.max(input_array) * 255)
+    # Not np.take, which casts the uint8 indices to an int64 copy
+    return cv2.LUT(input_array, lut, dst=input_array)
+
+# Mask and image of one sample: (input_mask, im_name, input_array), or None if skipped
+def load_sample(cfg, mask_name):
+    loaded = load_mask(cfg, mask_name)
+    if loaded is None:
+        return None
+    input_mask, im_name = loaded
+    input_array = load_image(cfg, im_name)
+    if input_array is None:
+        return None
+    return input_mask, im_name, input_array
+
+# Binary uint8 mask of class index cls: label cls+1 if num_class > 1,
+# else we combine all the masks as the same class. Built per class from
+# the label comparison (a bool array viewed as uint8) instead of slicing an
+# int64 HxWxnum_class one-hot array
+def class_mask(input_mask, num_class, cls):
+    if num_class > 1:
+        return (input_mask == cls + 1).view(np.uint8)
+    return (input_mask > 0).view(np.uint8)
+
+# Save the scores of one dataset in the result store, as
+# <score_dir>/<version>_results_<dataset>.npz (see results.py); info holds
+# the run settings the tables are grouped by
+def save_scores(score_dir, version, dataset, dc_log, names, info=None):
+    scores = save_results(score_dir, version, dataset, dc_log, names, info)
+    logger.info('%s scores %s', dataset, scores.shape)
+    if len(scores):
+        logger.info('%s', np.nanmean(scores, axis=0))
+        logger.info('%s', np.nanmean(scores))
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import logging
+import os
+
+from data_utils import list_masks, load_mask
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Cached index of a dataset
+#   Built once from list_masks + load_mask and saved as
+#   <index_dir>/<dataset>.json, it lists every mask in evaluation
+#   (os.listdir) order with
+#     'image'       the matching image name, None if the mask is empty or
+#                   unreadable (such masks are never evaluated)
+#   so that runs skip listing seg_dir and reading the empty masks.
+# The index is rebuilt when the dataset config changes or when files are
+# added to / removed from seg_dir (its mtime changes). A mask overwritten in
+# place does not change the mtime: use --rebuild-index.
+####################################################
+
+INDEX_DIR = '.dataset_index'
+INDEX_VERSION = 1
+
+def _mask_entry(cfg, mask_name):
+    loaded = load_mask(cfg, mask_name)
+    if loaded is None:
+        return {'mask': mask_name, 'image': None}
+    return {'mask': mask_name, 'image': loaded[1]}
+
+class DatasetIndex:
+    def __init__(self, cfg, entries):
+        self.cfg = cfg
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    # Names of the masks to evaluate (non-empty unless skip_empty is False),
+    # optionally only those in im_list
+    def masks(self, im_list=None, skip_empty=True):
+        return [entry['mask'] for entry in self.entries
+                if (entry['image'] is not None or not skip_empty) and (im_list is None or entry['mask'] in im_list)]
+
+def _index_path(index_dir, cfg):
+    return os.path.join(index_dir, '%s.json' % cfg['name'])
+
+# Config as it reads back from JSON, to compare with the saved one
+def _config_key(cfg):
+    return json.loads(json.dumps(cfg))
+
+def build_index(cfg, io_threads=4):
+    mask_list = list_masks(cfg)
+    with ThreadPoolExecutor(max(1, io_threads)) as pool:
+        entries = list(pool.map(lambda mask_name: _mask_entry(cfg, mask_name), mask_list))
+    return DatasetIndex(cfg, entries)
+
+def load_index(cfg, index_dir=INDEX_DIR, rebuild=False, io_threads=4):
+    path = _index_path(index_dir, cfg)
+    seg_mtime = os.stat(cfg['seg_dir']).st_mtime_ns
+    if not rebuild and os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        if (saved.get('version') == INDEX_VERSION and saved['seg_mtime'] == seg_mtime
+                and saved['config'] == _config_key(cfg)):
+            return DatasetIndex(cfg, saved['masks'])
+        logger.info('Index of %s is out of date, rebuilding', cfg['name'])
+
+    index = build_index(cfg, io_threads)
+    logger.info('Indexed %s: %s masks, %s empty or unreadable', cfg['name'], len(index),
+                len(index) - len(index.masks()))
+    os.makedirs(index_dir, exist_ok=True)
+    # Written aside and renamed, so an interrupted run never leaves half an index
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'config': cfg, 'seg_mtime': seg_mtime, 'masks': index.entries}, f)
+    os.replace(tmp_path, path)
+    return index
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+####################################################
+# On-disk cache of SAM image embeddings
+#   Each entry is keyed by the content hash of the normalized input_array
+#   (the uint8 HxWx3 array handed to predictor.set_image) together with the
+#   identity of the checkpoint that produced it, and is stored as
+#     <key>.npy   features, 1xCxhxw (C=256, h=w=64 for SAM)
+#     <key>.json  original_size / input_size needed by predict()
+#   The .json file is written last and marks the entry as complete.
+#   Reads are memory-mapped. When max_bytes is given, least recently used
+#   entries are evicted (file mtime is refreshed on every hit).
+####################################################
+
+CHECKPOINT_PROBE_BYTES = 2**20
+
+# Identity of a checkpoint without hashing a multi-GB file: its name, size
+# and a hash of its first and last MB. Fine-tuned checkpoints of the same
+# name and size differ there (the first tensors, and the CRC-32 of every
+# tensor in the zip directory at the end of a torch.save file). Then the
+# precision its encoder ran at (sam_model.PRECISIONS) if not fp32
+def checkpoint_id(checkpoint_path, model_type='default', precision='fp32'):
+    size = os.stat(checkpoint_path).st_size
+    h = hashlib.sha1()
+    with open(checkpoint_path, 'rb') as f:
+        h.update(f.read(CHECKPOINT_PROBE_BYTES))
+        f.seek(max(CHECKPOINT_PROBE_BYTES, size - CHECKPOINT_PROBE_BYTES))
+        h.update(f.read())
+    ckpt_id = '%s:%s:%d:%s' % (model_type, os.path.basename(checkpoint_path), size, h.hexdigest()[:16])
+    return ckpt_id if precision == 'fp32' else '%s:%s' % (ckpt_id, precision)
+
+
+# Put a SamPredictor in the "image set" state from a cached entry,
+# the same state predictor.set_image(...) would leave it in
+def restore_predictor(predictor, entry):
+    import torch
+    predictor.reset_image()
+    predictor.original_size = tuple(entry['original_size'])
+    predictor.input_size = tuple(entry['input_size'])
+    # A memory-mapped cache entry or a tensor of batch_encode: shared on the
+    # CPU, copied once to a GPU, never read whole into RAM first
+    predictor.features = torch.as_tensor(entry['features'], device=predictor.device)
+    predictor.is_image_set = True
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, ckpt_id, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.ckpt_id = ckpt_id
+        self.max_bytes = max_bytes
+        self.hits, self.misses, self.evictions = 0, 0, 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key -> [last access time, bytes on disk]; only complete entries are tracked
+        self._entries = {}
+        for f in os.listdir(cache_dir):
+            if not f.endswith('.json'):
+                continue
+            key = f[:-5]
+            try:
+                st = os.stat(self._path(key, '.npy'))
+            except OSError:
+                continue
+            self._entries[key] = [st.st_mtime, st.st_size + os.path.getsize(self._path(key, '.json'))]
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def total_bytes(self):
+        return sum(size for _, size in self._entries.values())
+
+    def key(self, input_array):
+        h = hashlib.sha1()
+        h.update(self.ckpt_id.encode())
+        h.update(('%s|%s' % (input_array.shape, input_array.dtype)).encode())
+        h.update(np.ascontiguousarray(input_array).data)
+        return h.hexdigest()
+
+    # Returns {'features', 'original_size', 'input_size'} or None
+    def get(self, key):
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        try:
+            with open(self._path(key, '.json')) as f:
+                meta = json.load(f)
+            # Copy-on-write: writable for torch, the file is never modified
+            features = np.load(self._path(key, '.npy'), mmap_mode='c')
+        except (OSError, ValueError):
+            # Entry removed by another process or truncated: treat as a miss
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Refresh mtime so the LRU order survives a restart
+        now = time.time()
+        try:
+            os.utime(self._path(key, '.npy'), (now, now))
+        except OSError:
+            pass
+        self._entries[key][0] = now
+        meta['features'] = features
+        return meta
+
+    def put(self, key, features, original_size, input_size):
+        # A torch tensor, or an array already
+        if hasattr(features, 'detach'):
+            features = features.detach().cpu().numpy()
+        # Write to temp files and rename so readers never see partial entries
+        npy_path, json_path = self._path(key, '.npy'), self._path(key, '.json')
+        with open(npy_path + '.tmp', 'wb') as f:
+            np.save(f, features)
+        os.replace(npy_path + '.tmp', npy_path)
+        with open(json_path + '.tmp', 'w') as f:
+            json.dump({'original_size': list(original_size), 'input_size': list(input_size)}, f)
+        os.replace(json_path + '.tmp', json_path)
+
+        self._entries[key] = [os.path.getmtime(npy_path), os.path.getsize(npy_path) + os.path.getsize(json_path)]
+        self.evict()
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        total = self.total_bytes
+        for key in sorted(self._entries, key=lambda k: self._entries[k][0]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries.pop(key)[1]
+            for ext in ('.json', '.npy'):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            self.evictions += 1
+
+    # Drop-in replacement for predictor.set_image(input_array)
+    def set_image(self, predictor, input_array):
+        key = self.key(input_array)
+        entry = self.get(key)
+        if entry is not None:
+            restore_predictor(predictor, entry)
+            return True
+        predictor.set_image(input_array)
+        self.put(key, predictor.features, predictor.original_size, predictor.input_size)
+        return False
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries), 'bytes': self.total_bytes}
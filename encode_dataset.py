@@ -0,0 +1,97 @@
+import argparse
+import logging
+import os
+import json
+
+from batch_encode import BatchEncoder, encoded_samples
+from embedding_cache import EmbeddingCache, checkpoint_id
+from data_utils import dataset_names, get_dataset_config, load_registry
+from dataset_index import INDEX_DIR, load_index
+from prefetch import prefetch_samples
+from sam_model import PRECISIONS, VARIANTS, load_sam, model_type, precision_error, resolve_checkpoint
+from instrument import LOG_LEVELS, setup_logging, stage, timer
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Stage 1 of the two-stage pipeline: encode every image of a dataset with
+# SAM's image encoder into an embedding store (an EmbeddingCache directory),
+# and write <store>/manifest_<dataset>.json listing, in evaluation order,
+#   {'mask': mask file name, 'image': image file name, 'key': embedding key}
+# together with the dataset config, so that stage 2
+# (eval_from_embeddings.py) only needs the masks and the store.
+# With encode_batch != 1 the images missing from the store are encoded that
+# many at a time (batch_encode.BatchEncoder, 0 picks the batch size).
+####################################################
+
+def manifest_path(store_dir, dataset):
+    return os.path.join(store_dir, 'manifest_%s.json' % dataset)
+
+def encode_dataset(predictor, store, cfg, mask_list, prefetch=4, io_threads=2, encode_batch=1):
+    samples = []
+    encoder = BatchEncoder(predictor, encode_batch, store) if encode_batch != 1 else None
+    loaded = timer.iterate('load', prefetch_samples(cfg, mask_list, prefetch, io_threads))
+    for mask_name, sample, encoding in encoded_samples(encoder, loaded):
+        if sample is None:
+            continue
+        _, im_name, input_array = sample
+
+        if encoding is not None:
+            # Encoded by the batch encoder, which also stored it
+            key = encoding['key']
+            timer.add('encode', encoding['seconds'])
+        else:
+            key = store.key(input_array)
+            if key not in store:
+                with stage('encode'):
+                    predictor.set_image(input_array)
+                store.put(key, predictor.features, predictor.original_size, predictor.input_size)
+        samples.append({'mask': mask_name, 'image': im_name, 'key': key})
+        timer.end_image()
+        logger.debug('%s %s', mask_name, key)
+
+    with open(manifest_path(store.cache_dir, cfg['name']), 'w') as f:
+        json.dump({'config': cfg, 'ckpt_id': store.ckpt_id, 'samples': samples}, f)
+    return samples
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Encode datasets into a SAM embedding store")
+    parser.add_argument("--model-path", default="./", type=str, help="the path of the model saved")
+    parser.add_argument("--sam-variant", default="vit_h", choices=list(VARIANTS), help="SAM backbone: vit_h (the paper's), vit_l, vit_b or mobile_sam (distilled encoder)")
+    parser.add_argument("--checkpoint", default=None, type=str, help="SAM checkpoint file, defaults to the variant's file in --model-path")
+    parser.add_argument("--device", default="cuda", type=str, help="device to run the model on, e.g. cuda, cuda:1 or cpu")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS, help="SAM image encoder: fp32, bf16 (autocast) or int8 (dynamically quantized linear layers, cpu only)")
+    parser.add_argument("--threads", default=0, type=int, help="number of torch threads, 0 keeps torch's default")
+    parser.add_argument("--init-path", default="./", type=str, help="the path of the dataset")
+    parser.add_argument("--dataset", default="all", type=str, help="dataset of the registry to encode, a comma separated list, or all")
+    parser.add_argument("--registry", default=None, type=str, help="dataset registry file, defaults to datasets.json")
+    parser.add_argument("--index-dir", default=INDEX_DIR, type=str, help="directory of the cached dataset indexes")
+    parser.add_argument("--rebuild-index", action="store_true", help="re-read every mask instead of using the cached dataset index")
+    parser.add_argument("--embedding-store", required=True, type=str, help="directory to store the embeddings in")
+    parser.add_argument("--prefetch", default=4, type=int, help="number of samples read ahead of the encoder, 0 reads them synchronously")
+    parser.add_argument("--io-threads", default=2, type=int, help="number of threads reading samples ahead")
+    parser.add_argument("--encode-batch", default=1, type=int, help="number of images per forward pass of the image encoder, 0 picks it from the free memory")
+    parser.add_argument("--log-level", default="info", choices=LOG_LEVELS, help="debug also logs every image")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    if precision_error(args.device, args.precision):
+        parser.error(precision_error(args.device, args.precision))
+    if args.encode_batch < 0:
+        parser.error('--encode-batch must be 0 (auto) or a positive batch size')
+
+    checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+    from segment_anything import SamPredictor
+    sam = load_sam(checkpoint, args.device, args.precision, args.threads, args.sam_variant)
+    predictor = SamPredictor(sam)
+    store = EmbeddingCache(args.embedding_store, checkpoint_id(checkpoint, model_type(args.sam_variant), args.precision))
+
+    registry = load_registry(args.registry)
+    dataset_list = dataset_names(args.dataset, registry)
+    for dataset in dataset_list:
+        logger.info('curr dataset %s', dataset)
+        cfg = get_dataset_config(dataset, args.init_path, registry)
+        mask_list = load_index(cfg, args.index_dir, args.rebuild_index, args.io_threads).masks()
+        timer.reset()
+        samples = encode_dataset(predictor, store, cfg, mask_list, args.prefetch, args.io_threads, args.encode_batch)
+        logger.info('# encoded %s %s', len(samples), store.stats())
+        logger.info('timing %s %s', dataset, json.dumps(timer.summary()))
@@ -0,0 +1,136 @@
+import argparse
+import logging
+import os
+import json
+import numpy as np
+
+from embedding_cache import EmbeddingCache, checkpoint_id, restore_predictor
+from data_utils import dataset_names, load_mask, save_scores
+from encode_dataset import manifest_path
+from protocols import click_protocol_image, mode_protocol_image
+from predictors import SamPredictorAdapter
+from sweep import unit_seed
+from sam_model import PRECISIONS, VARIANTS, load_sam, model_type, resolve_checkpoint, sam_name
+from instrument import LOG_LEVELS, setup_logging, stage, timer, write_summary
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Stage 2 of the two-stage pipeline: run the v1 iterative-click protocol or
+# the v2 five-mode protocol against embeddings written by encode_dataset.py.
+# Only SAM's prompt encoder and mask decoder run here; images are not read.
+# Scores are saved under the same names as the one-stage scripts.
+####################################################
+
+# Replaces the ViT image encoder by a module that only keeps img_size, which
+# SAM still reads when resizing prompts and masks (torch is imported here,
+# with the model, so that importing this script stays light)
+def drop_image_encoder(sam):
+    import torch
+
+    class _NoImageEncoder(torch.nn.Module):
+        def __init__(self, img_size):
+            super().__init__()
+            self.img_size = img_size
+
+        def forward(self, x):
+            raise RuntimeError('image encoder was dropped, embeddings must come from the store')
+
+    sam.image_encoder = _NoImageEncoder(sam.image_encoder.img_size)
+    return sam
+
+# Same names as the one-stage scripts
+def score_version(args):
+    if args.protocol == 'v1':
+        version = sam_name(args.sam_variant) + '_prompt'
+        if args.refine:
+            version += '_refine'
+    else:
+        version = sam_name(args.sam_variant) + '_diffmode'
+        if args.oracle:
+            version += '_oracle'
+    if args.oracle and args.score_res:
+        version += '_score%d' % args.score_res
+    if args.precision != 'fp32':
+        version += '_' + args.precision
+    return version
+
+# Same settings as the run_info of the one-stage scripts
+def run_info(args):
+    if args.protocol == 'v1':
+        info = {'protocol': 'v1', 'model': 'sam', 'num_prompt': args.num_prompt, 'oracle': bool(args.oracle),
+                'refine': args.refine, 'score_res': args.score_res}
+    else:
+        info = {'protocol': 'v2', 'oracle': bool(args.oracle), 'score_res': args.score_res}
+    if args.precision != 'fp32':
+        info['precision'] = args.precision
+    if args.sam_variant != 'vit_h':
+        info['sam_variant'] = args.sam_variant
+    return info
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate prompts against stored SAM embeddings")
+    parser.add_argument("--protocol", default="v2", choices=["v1", "v2"], help="v1 (iterative clicks) or v2 (5 modes)")
+    parser.add_argument("--num-prompt", default=1, type=int, help="number of clicks for the v1 protocol")
+    parser.add_argument("--refine", action="store_true", help="v1: feed the previous low-res logits back as mask_input at each click")
+    parser.add_argument("--score-res", default=0, type=int, help="oracle mode: pick the best output on a grid of this long side and only upscale that one, 0 picks at full size")
+    parser.add_argument("--model-path", default="./", type=str, help="the path of the model saved")
+    parser.add_argument("--sam-variant", default="vit_h", choices=list(VARIANTS), help="SAM backbone: vit_h (the paper's), vit_l, vit_b or mobile_sam (distilled encoder)")
+    parser.add_argument("--checkpoint", default=None, type=str, help="SAM checkpoint file the embeddings were encoded with, defaults to the variant's file in --model-path")
+    parser.add_argument("--device", default="cuda", type=str, help="device to run the model on, e.g. cuda, cuda:1 or cpu")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS, help="precision the embeddings were encoded at by encode_dataset.py")
+    parser.add_argument("--threads", default=0, type=int, help="number of torch threads, 0 keeps torch's default")
+    parser.add_argument("--oracle", default=False, type=bool, help="whether eval in the oracle mode, where best prediction is selected based on GT")
+    parser.add_argument("--dataset", default="all", type=str, help="dataset to evaluate, a comma separated list, or all")
+    parser.add_argument("--embedding-store", required=True, type=str, help="directory written by encode_dataset.py")
+    parser.add_argument("--log-level", default="info", choices=LOG_LEVELS, help="debug also logs every image, class and prompt")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+    from segment_anything import SamPredictor
+    sam = drop_image_encoder(load_sam(checkpoint, args.device, 'fp32', args.threads, args.sam_variant))
+    predictor = SamPredictor(sam)
+    adapter = SamPredictorAdapter(predictor, refine=args.refine, score_res=args.score_res)
+    store = EmbeddingCache(args.embedding_store, checkpoint_id(checkpoint, model_type(args.sam_variant), args.precision))
+
+    dataset_list = dataset_names(args.dataset)
+    for dataset in dataset_list:
+        logger.info('curr dataset %s', dataset)
+        with open(manifest_path(args.embedding_store, dataset)) as f:
+            manifest = json.load(f)
+        if manifest['ckpt_id'] != store.ckpt_id:
+            raise ValueError('embeddings of %s were computed with %s, not %s' % (dataset, manifest['ckpt_id'], store.ckpt_id))
+        cfg = manifest['config']
+        num_class = cfg['num_class']
+
+        dc_log, names = [], []
+        timer.reset()
+        for sample in manifest['samples']:
+            logger.debug(sample['mask'])
+            with stage('load'):
+                loaded = load_mask(cfg, sample['mask'])
+                entry = store.get(sample['key'])
+            if loaded is None or entry is None:
+                logger.warning('Missing mask or embedding %s', sample['mask'])
+                continue
+            input_mask, im_name = loaded
+            with stage('encode'):
+                restore_predictor(predictor, entry)
+            # Seeded per image as in the evaluation scripts
+            np.random.seed(unit_seed(dataset, sample['mask']))
+
+            if args.protocol == 'v1':
+                dc_class_tmp, _ = click_protocol_image(adapter, None, input_mask, num_class,
+                                                       args.num_prompt, args.oracle)
+            else:
+                dc_class_tmp, _ = mode_protocol_image(predictor, input_mask, num_class, args.oracle,
+                                                      score_res=args.score_res)
+            dc_log.append(dc_class_tmp)
+            names.append(im_name)
+            timer.end_image()
+
+        logger.info('embedding store %s', store.stats())
+        score_dir = 'scores/v1_rerun' if args.protocol == 'v1' else 'scores/v2'
+        save_scores(score_dir, score_version(args), dataset, dc_log, names, run_info(args))
+        write_summary(score_dir, score_version(args), dataset, timer.summary())
@@ -0,0 +1,233 @@
+from skimage.morphology import medial_axis
+
+import logging
+
+import numpy as np
+
+from region_profile import RegionProfile
+
+logger = logging.getLogger(__name__)
+
+#This is a helper function that should not be called directly
+# medial_axis breaks ties at random; seed=None draws a new order every call
+def _medial_axis(binary_msk, seed=None):
+    try:
+        return medial_axis(binary_msk, rng=seed)
+    except TypeError:
+        # scikit-image < 0.21 calls it random_state
+        return medial_axis(binary_msk, random_state=seed)
+
+def _find_closest(centroid, pos_points):
+    dist_squared = np.sum((pos_points - centroid)**2, axis=1)
+    point_idx = np.argmin(dist_squared)
+    return pos_points[point_idx]
+
+def IOU(pm, gt):
+    a = np.sum(np.bitwise_and(pm, gt))
+    b = np.sum(pm) + np.sum(gt) - a #+ 1e-8 
+    if b == 0:
+        return -1
+    else:
+        return a / b
+
+def IOUMulti(y_pred, y):
+    score = 0
+    numLabels = np.max(y)
+    if np.max(y) == 1:
+        score = IOU(y_pred, y)
+        return score
+    else:
+        count = 1
+        for index in range(1,numLabels+1):
+            curr_score = IOU(y_pred[y==index], y[y==index])
+            logger.debug('%s %s', index, curr_score)
+            if curr_score != -1:
+                score += curr_score
+                count += 1
+        return score / (count - 1) # taking average
+
+####################################################
+# input: raw_msk
+#   A mask should containing no 'void' class. 
+#   Binary mask should have value {0,1} but not {0,255}
+# output:
+#   A list of region profiles; Each profile takes the form
+#   {'loc':[x0,y0,x1,y1], 'cls': cls}
+#   'loc' is a list with 4 elements ; 'cls' is object class as integer 
+####################################################
+def MaskToBoxSimple(mask):
+    mask = mask.squeeze()
+    #find coordinates of points in the region
+    row, col = np.argwhere(mask).T
+    # find the four corner coordinates
+    y0,x0 = row.min(),col.min()
+    y1,x1 = row.max(),col.max()
+
+    return [x0,y0,x1,y1]
+
+####################################################
+# input: raw_msk
+#   A mask should containing no 'void' class. 
+#   Binary mask should have value {0,1} but not {0,255}
+# output:
+#   A list of region profiles; Each profile takes the form
+#   {'loc':[x0,y0,x1,y1], 'cls': cls}
+#   'loc' is a list with 4 elements ; 'cls' is object class as integer 
+####################################################
+def MaskToBoxes(mask):
+    profile = RegionProfile(mask)
+    
+    bbox_profiles = []
+    for region_id  in range(1, profile.num+1):
+        bbox_profiles.append({'loc':profile.bbox(region_id), 'cls':profile.region_class(region_id)})
+        
+    return bbox_profiles
+
+####################################################
+# input: raw_msk
+#   A mask should containing no 'void' class. 
+#   Binary mask should have value {0,1} but not {0,255}
+# input: N
+#   The number of points to apply on each object/connected region
+# input: seed
+#   Seed of the skeleton's tie-breaking, random if None
+# output:
+#   A list of region profiles. Each region profile takes the form
+#   {'loc':np.array([[x0,y0],[x1,y1],[x_N,y_N]]), 'cls': cls}
+#   'loc' is 2D array with shape (N, 2); 'cls' is object class as integer 
+####################################################
+def Mask2Points(raw_msk, N=1, seed=None):
+    profile = RegionProfile(raw_msk)
+    point_profiles = []
+
+    for region_id  in range(1, profile.num+1):
+        # clean some region that is abnormally small
+        r = profile.area(region_id) / raw_msk.size
+        if r < 1e-4:
+            continue
+        logger.debug('mask ratio %s', r)
+        #if len(pos_points) < len(raw_msk.flatten())*0.001:
+        #    continue
+            
+        #get the skeleton
+        binary_msk = profile.region_mask(region_id)
+        skeleton_msk = _medial_axis(binary_msk, seed).astype(np.uint8)
+        skeleton_points = np.argwhere(skeleton_msk>0)
+
+        # Cluster and assign the object skeleton into N sections
+        # (sklearn is slow to import and only used here)
+        from sklearn.cluster import KMeans
+        #kmean = KMeans(n_clusters=N,n_init=3, algorithm='lloyd' if N == 1 else 'elkan').fit(skeleton_points)
+        kmean = KMeans(n_clusters=N,n_init=3, algorithm='lloyd').fit(skeleton_points)
+        cluster_assigned = np.zeros(len(skeleton_points)) if N == 1 else kmean.predict(skeleton_points)
+        centroids = kmean.cluster_centers_
+        
+        # pick a skeleton point closest to the centroid from each cluster
+        selected_points = np.zeros((N,2)) 
+        for cluster_id, centroid in zip(range(N),centroids):
+            points_in_cluster = skeleton_points[cluster_assigned==cluster_id] 
+            selected_points[cluster_id] = _find_closest(centroid,points_in_cluster)
+            
+        #find class of the region
+        cls = profile.region_class(region_id)
+        
+        point_profiles.append({'loc':np.concatenate((selected_points[:,1:],selected_points[:,0:1]),axis=1), 'cls':cls})
+        
+        #TODO: double check if > 1 regions found
+        break
+        
+    return point_profiles
+
+# Skeleton of regions as {region_id: (row, col) points in the full mask}.
+# medial_axis runs once, on the bbox of the regions grown by 1 pixel (where
+# the image allows). For a single region this is the same skeleton as on the
+# full-size region mask with the same seed: the grown border is background,
+# so the distance transform, the 3x3 neighbourhoods and the order of the
+# region pixels are unchanged. With several regions, only the random
+# tie-breaking differs from one call per region, and the lookup table that
+# medial_axis builds on every call (~30 ms) is only built once.
+def _skeleton_points(profile, region_ids, seed=0):
+    H, W = profile.label_msk.shape
+    boxes = np.array([profile.bbox(i) for i in region_ids])
+    y0, x0 = max(boxes[:,1].min()-1, 0), max(boxes[:,0].min()-1, 0)
+    y1, x1 = min(boxes[:,3].max()+2, H), min(boxes[:,2].max()+2, W)
+    crop_labels = profile.label_msk[y0:y1, x0:x1]
+    points = np.argwhere(_medial_axis(np.isin(crop_labels, region_ids), seed))
+    point_labels = crop_labels[points[:,0], points[:,1]]
+    return {i: points[point_labels==i] + (y0, x0) for i in region_ids}
+
+####################################################
+# Deterministic k-means of skeleton points, replacing KMeans(n_init=3)
+#   Seeds: the point closest to the mean, then repeatedly the point farthest
+#   from the seeds so far (farthest-point sampling), followed by at most
+#   max_iter vectorized Lloyd steps. With N=1 the centroid is the mean, as
+#   with KMeans. If there are fewer points than N, some seeds are the same
+#   point: the clusters after the first of them get no point and keep their
+#   centroid (Mask2PointsFast then takes the closest of all the points).
+# output:
+#   (centroids Nx2, cluster of each point)
+####################################################
+def _skeleton_kmeans(points, N, max_iter=10):
+    points = points.astype(np.float64)
+    centroids = points.mean(axis=0, keepdims=True)
+    if N > 1:
+        seeds = [np.argmin(np.sum((points - centroids)**2, axis=1))]
+        min_dist = np.sum((points - points[seeds[0]])**2, axis=1)
+        for _ in range(N-1):
+            seeds.append(np.argmax(min_dist))
+            min_dist = np.minimum(min_dist, np.sum((points - points[seeds[-1]])**2, axis=1))
+        centroids = points[seeds]
+    for _ in range(max_iter):
+        assigned = np.argmin(((points[:,None,:] - centroids[None])**2).sum(-1), axis=1)
+        if N == 1:
+            break
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assigned, points)
+        counts = np.bincount(assigned, minlength=N)[:,None]
+        # Empty clusters keep their centroid
+        new_centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+        if np.array_equal(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return centroids, assigned
+
+####################################################
+# Faster Mask2Points, same input and output format
+#   The skeleton is computed on the bbox crop of the regions only, and the
+#   skeleton points are clustered by _skeleton_kmeans instead of KMeans, so
+#   the points are deterministic. With N=1 the selected point is the same
+#   as Mask2Points' with the same seed (the skeleton point closest to the
+#   skeleton mean).
+# input: all_regions
+#   Return a profile for every region kept (area >= 1e-4 of the image)
+#   instead of only the first one, as Mask2Points does
+####################################################
+def Mask2PointsFast(raw_msk, N=1, all_regions=False, seed=0):
+    profile = RegionProfile(raw_msk)
+    point_profiles = []
+
+    # clean some region that is abnormally small
+    region_ids = [i for i in range(1, profile.num+1) if profile.area(i) / raw_msk.size >= 1e-4]
+    if not all_regions:
+        region_ids = region_ids[:1]
+    if len(region_ids) == 0:
+        return point_profiles
+    skeletons = _skeleton_points(profile, region_ids, seed)
+
+    for region_id in region_ids:
+        logger.debug('mask ratio %s', profile.area(region_id) / raw_msk.size)
+        skeleton_points = skeletons[region_id]
+        centroids, cluster_assigned = _skeleton_kmeans(skeleton_points, N)
+
+        # pick a skeleton point closest to the centroid from each cluster
+        selected_points = np.zeros((N,2))
+        for cluster_id, centroid in enumerate(centroids):
+            points_in_cluster = skeleton_points[cluster_assigned==cluster_id]
+            if len(points_in_cluster) == 0:
+                points_in_cluster = skeleton_points
+            selected_points[cluster_id] = _find_closest(centroid, points_in_cluster)
+
+        cls = profile.region_class(region_id)
+        point_profiles.append({'loc':np.concatenate((selected_points[:,1:],selected_points[:,0:1]),axis=1), 'cls':cls})
+
+    return point_profiles
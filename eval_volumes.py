@@ -0,0 +1,170 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+
+from embedding_cache import EmbeddingCache, checkpoint_id
+from data_utils import dataset_names, get_dataset_config, load_image, load_mask, load_registry, save_scores
+from dataset_index import INDEX_DIR, load_index
+from prefetch import prefetch_samples
+from protocols import CARRY_AREA, CARRY_SLICES, volume_protocol_image
+from sweep import unit_seed
+from volumes import VolumeScores, group_volumes
+from sam_model import PRECISIONS, VARIANTS, load_sam, model_type, precision_error, resolve_checkpoint, sam_name
+from instrument import LOG_LEVELS, setup_logging, stage, timer, write_summary
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Volume mode for 3D datasets exported as 2D slices
+#   Slices are grouped by volume (volumes.group_volumes) and streamed in
+#   slice order. Every slice costs one decoder call per class
+#   (protocols.volume_protocol_image): a center click plus the logits
+#   selected on the previous slice. A class is carried onto at most
+#   --carry-slices following slices where it is absent (fewer if its
+#   prediction shrinks below --carry-area of the object), and what it
+#   predicts there counts against its 3D IoU. The image of an empty slice is
+#   only read and encoded when a class is carried onto it.
+# Saved per dataset in scores/volume:
+#   <version>_results_<dataset>.npz         volumes x classes x 1 3D IoU, with
+#                                           the volume ids as names
+#   <version>_volumes_<dataset>.json        per volume: slices, decoder calls,
+#                                           3D IoU, mean 2D IoU and carried
+#                                           slices per class
+####################################################
+
+def setup(args):
+    from segment_anything import SamPredictor
+    sam = load_sam(args.checkpoint, args.device, args.precision, args.threads, args.sam_variant)
+    predictor = SamPredictor(sam)
+    cache = None
+    if args.embedding_cache is not None:
+        cache = EmbeddingCache(args.embedding_cache, checkpoint_id(args.checkpoint, model_type(args.sam_variant), args.precision),
+                               max_bytes=int(args.cache_size * 1024**3) if args.cache_size > 0 else None)
+    return predictor, cache
+
+# Like load_sample, but empty slices are kept and their image left unread
+# (input_array None): most of them are never run through the model
+def load_slice(cfg, mask_name):
+    loaded = load_mask(cfg, mask_name, keep_empty=True)
+    if loaded is None:
+        return None
+    input_mask, im_name = loaded
+    if not input_mask.any():
+        return input_mask, im_name, None
+    input_array = load_image(cfg, im_name)
+    if input_array is None:
+        return None
+    return input_mask, im_name, input_array
+
+def evaluate_volume(predictor, cache, args, cfg, volume, slices):
+    scores = VolumeScores(cfg['num_class'])
+    # Prompt RNG seeded per volume, as the other scripts seed it per image:
+    # the prompts do not depend on which volumes are evaluated before
+    np.random.seed(unit_seed(cfg['name'], volume))
+    # Click and logits of the previous slice, per class
+    state = {}
+    for mask_name, sample in timer.iterate('load', prefetch_samples(cfg, slices, args.prefetch, args.io_threads,
+                                                                    loader=load_slice)):
+        if sample is None:
+            # Unreadable slice: the objects are not carried over it
+            state.clear()
+            continue
+        input_mask, im_name, input_array = sample
+        if input_array is None:
+            if not state or not args.carry_slices:
+                # Empty slice with nothing carried onto it
+                state.clear()
+                continue
+            with stage('load'):
+                input_array = load_image(cfg, im_name)
+            if input_array is None:
+                state.clear()
+                continue
+        logger.debug(mask_name)
+        with stage('encode'):
+            if cache is not None:
+                cache.set_image(predictor, input_array)
+            else:
+                predictor.set_image(input_array)
+        volume_protocol_image(predictor, input_mask, cfg['num_class'], args.oracle, state, scores,
+                              score_res=args.score_res, carry_slices=args.carry_slices, carry_area=args.carry_area)
+        timer.end_image()
+    return scores.summary(volume)
+
+def score_version(args):
+    version = sam_name(args.sam_variant) + '_volume'
+    if args.oracle:
+        version += '_oracle'
+        if args.score_res:
+            version += '_score%d' % args.score_res
+    if args.precision != 'fp32':
+        version += '_' + args.precision
+    return version
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Volume-wise evaluation of SAM on slice datasets")
+    parser.add_argument("--model-path", default="./", type=str, help="the path of the model saved")
+    parser.add_argument("--sam-variant", default="vit_h", choices=list(VARIANTS), help="SAM backbone: vit_h (the paper's), vit_l, vit_b or mobile_sam (distilled encoder)")
+    parser.add_argument("--checkpoint", default=None, type=str, help="SAM checkpoint file, defaults to the variant's file in --model-path")
+    parser.add_argument("--device", default="cuda", type=str, help="device to run the model on, e.g. cuda, cuda:1 or cpu")
+    parser.add_argument("--precision", default="fp32", choices=PRECISIONS, help="SAM image encoder: fp32, bf16 (autocast) or int8 (dynamically quantized linear layers, cpu only)")
+    parser.add_argument("--threads", default=0, type=int, help="number of torch threads, 0 keeps torch's default")
+    parser.add_argument("--init-path", default="./", type=str, help="the path of the dataset")
+    parser.add_argument("--dataset", default="all", type=str, help="dataset of the registry to evaluate, a comma separated list, or all")
+    parser.add_argument("--registry", default=None, type=str, help="dataset registry file, defaults to datasets.json")
+    parser.add_argument("--index-dir", default=INDEX_DIR, type=str, help="directory of the cached dataset indexes")
+    parser.add_argument("--rebuild-index", action="store_true", help="re-read every mask instead of using the cached dataset index")
+    parser.add_argument("--volume-pattern", default=None, type=str, help="regex with 'volume' and 'slice' groups matching the mask names, defaults to the last number being the slice index")
+    parser.add_argument("--oracle", default=False, type=bool, help="whether eval in the oracle mode, where best prediction is selected based on GT")
+    parser.add_argument("--score-res", default=0, type=int, help="oracle mode: pick the best output on a grid of this long side and only upscale that one, 0 picks at full size")
+    parser.add_argument("--carry-slices", default=CARRY_SLICES, type=int, help="number of slices past the end of an object its prompt is still decoded on, its prediction there counting as false positive; 0 disables")
+    parser.add_argument("--carry-area", default=CARRY_AREA, type=float, help="stop carrying an object once its predicted area falls below this fraction of its area on its last slice")
+    parser.add_argument("--embedding-cache", default=None, type=str, help="directory of the on-disk SAM embedding cache, disabled if not given")
+    parser.add_argument("--cache-size", default=0, type=float, help="maximum size of the embedding cache in GB, 0 means unbounded")
+    parser.add_argument("--prefetch", default=4, type=int, help="number of slices read ahead of the model, 0 reads them synchronously")
+    parser.add_argument("--io-threads", default=2, type=int, help="number of threads reading slices ahead")
+    parser.add_argument("--log-level", default="info", choices=LOG_LEVELS, help="debug also logs every slice and class")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    if precision_error(args.device, args.precision):
+        parser.error(precision_error(args.device, args.precision))
+    args.checkpoint = resolve_checkpoint(args.model_path, args.sam_variant, args.checkpoint)
+
+    score_dir = 'scores/volume'
+    os.makedirs(score_dir, exist_ok=True)
+    predictor, cache = setup(args)
+    registry = load_registry(args.registry)
+    dataset_list = dataset_names(args.dataset, registry)
+    for dataset in dataset_list:
+        logger.info('curr dataset %s', dataset)
+        cfg = get_dataset_config(dataset, args.init_path, registry)
+        # Empty slices are kept: they break the propagation between slices
+        mask_list = load_index(cfg, args.index_dir, args.rebuild_index, args.io_threads).masks(skip_empty=False)
+        volumes = group_volumes(mask_list, args.volume_pattern or cfg.get('volume_pattern'))
+        logger.info('# of volumes %s', len(volumes))
+
+        timer.reset()
+        dc_log, names, summaries = [], [], []
+        for volume, slices in volumes:
+            summary = evaluate_volume(predictor, cache, args, cfg, volume, slices)
+            if summary['slices'] == 0:
+                continue
+            logger.info('%s: %s slices, %s decoder calls, 3D IoU %s', volume, summary['slices'],
+                        summary['decoder_calls'], summary['iou3d'])
+            summaries.append(summary)
+            dc_log.append([np.nan if iou is None else iou for iou in summary['iou3d']])
+            names.append(volume)
+
+        if cache is not None:
+            logger.info('embedding cache %s', cache.stats())
+        info = {'protocol': 'volume', 'oracle': bool(args.oracle), 'score_res': args.score_res}
+        if args.precision != 'fp32':
+            info['precision'] = args.precision
+        if args.sam_variant != 'vit_h':
+            info['sam_variant'] = args.sam_variant
+        save_scores(score_dir, score_version(args), dataset, dc_log, names, info)
+        with open('%s/%s_volumes_%s.json' % (score_dir, score_version(args), dataset), 'w') as f:
+            json.dump(summaries, f, indent=1)
+        write_summary(score_dir, score_version(args), dataset, timer.summary())
@@ -0,0 +1,90 @@
+import contextlib
+import json
+import logging
+import time
+
+import numpy as np
+
+####################################################
+# Logging and per-stage timing of the evaluation scripts
+#   Modules log through logging.getLogger(__name__): per image, class, mode
+#   and region details are DEBUG, per dataset progress is INFO, skipped or
+#   unreadable samples are WARNING. setup_logging picks the level
+#   (--log-level of the scripts), so the hot loops do no console I/O by default.
+#   Stages (load, encode, prompt, decode, score) are timed with
+#       with stage('decode'): ...
+#   on the module-level timer; every call of a stage within one image adds up
+#   to that image's time for the stage. The scripts close each image with
+#   timer.end_image() and write timer.summary() at the end of each dataset.
+####################################################
+
+LOG_LEVELS = ('debug', 'info', 'warning')
+
+def setup_logging(level='info'):
+    level = getattr(logging, level.upper())
+    logging.basicConfig(format='%(message)s', level=level, force=True)
+    # Keep the debug output of the image libraries out of ours
+    for name in ('PIL', 'matplotlib'):
+        logging.getLogger(name).setLevel(max(level, logging.INFO))
+
+class StageTimer:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # stage -> seconds spent in it by each image
+        self.times = {}
+        self._current = {}
+        self.images = 0
+        self.start = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current[name] = self._current.get(name, 0.0) + time.perf_counter() - start
+
+    # Time spent waiting on each item of an iterable (e.g. the sample reader)
+    def iterate(self, name, iterable):
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    # Share of a stage run once for several images (e.g. a batch of the
+    # image encoder), added to the current image
+    def add(self, name, seconds):
+        self._current[name] = self._current.get(name, 0.0) + seconds
+
+    def end_image(self):
+        for name, seconds in self._current.items():
+            self.times.setdefault(name, []).append(seconds)
+        self._current = {}
+        self.images += 1
+
+    # Throughput since the last reset and p50/p95 latency of each stage per image
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        stages = {}
+        for name, seconds in self.times.items():
+            ms = 1000 * np.asarray(seconds)
+            stages[name] = {'images': len(ms), 'total_s': round(float(ms.sum()) / 1000, 3),
+                            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                            'p95_ms': round(float(np.percentile(ms, 95)), 3)}
+        return {'images': self.images, 'elapsed_s': round(elapsed, 3),
+                'images_per_s': round(self.images / elapsed, 3) if elapsed > 0 else None, 'stages': stages}
+
+timer = StageTimer()
+stage = timer.stage
+
+# Log the summary of one dataset and save it as <score_dir>/<version>_timing_<dataset>.json
+def write_summary(score_dir, version, dataset, summary):
+    logging.getLogger(__name__).info('timing %s %s', dataset, json.dumps(summary))
+    with open('%s/%s_timing_%s.json' % (score_dir, version, dataset), 'w') as f:
+        json.dump(summary, f, indent=1)
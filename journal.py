@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Append-only journal of per-sample results, so that an interrupted sweep
+# can be resumed instead of restarted.
+#   The first line is a header with the run settings; every evaluated
+#   sample then adds one line
+#     {'dataset', 'mask', 'image', 'scores'}
+#   where scores is the sample's dc_class_tmp (class x mode/click IoUs,
+#   NaN for absent classes), or image/scores are null if the sample was
+#   skipped (unreadable or empty). A line is flushed to disk as soon as the
+#   sample is scored. A line torn by a crash is dropped when resuming.
+# input: run_info
+#   JSON-serialisable settings of the run (protocol, number of prompts, ...);
+#   resuming a journal written with other settings raises ValueError.
+####################################################
+
+def _to_json(value):
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return _to_json(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+class ResultJournal:
+    def __init__(self, path, run_info, resume=False):
+        self.path = path
+        self.run_info = json.loads(json.dumps(run_info))
+        # (dataset, mask name) -> record
+        self.records = {}
+
+        if resume and os.path.exists(path) and self._load():
+            self._file = open(path, 'a')
+        else:
+            self._file = open(path, 'w')
+            self._write({'header': self.run_info})
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        good_bytes = 0
+        for i, line in enumerate(lines):
+            # Only the last line can be incomplete
+            if i == len(lines) - 1 and not line.endswith(b'\n'):
+                logger.warning('Dropping incomplete journal line')
+                break
+            record = json.loads(line)
+            if i == 0:
+                if record.get('header') != self.run_info:
+                    raise ValueError('journal %s was written by another run: %s, expected %s'
+                                     % (self.path, record.get('header'), self.run_info))
+            else:
+                self.records[(record['dataset'], record['mask'])] = record
+            good_bytes += len(line)
+        if good_bytes < os.path.getsize(self.path):
+            os.truncate(self.path, good_bytes)
+        # False if not even the header made it to disk
+        return good_bytes > 0
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def __len__(self):
+        return len(self.records)
+
+    def done(self, dataset, mask_name):
+        return (dataset, mask_name) in self.records
+
+    # result: (im_name, dc_class_tmp), or None if the sample was skipped
+    def record(self, dataset, mask_name, result):
+        im_name, scores = (None, None) if result is None else result
+        record = {'dataset': dataset, 'mask': mask_name, 'image': im_name, 'scores': _to_json(scores)}
+        self._write(record)
+        self.records[(dataset, mask_name)] = record
+
+    # dc_log and names of a dataset, in mask_list order, skipping unscored samples
+    def scores(self, dataset, mask_list):
+        dc_log, names = [], []
+        for mask_name in mask_list:
+            record = self.records.get((dataset, mask_name))
+            if record is None or record['scores'] is None:
+                continue
+            dc_log.append(record['scores'])
+            names.append(record['image'])
+        return dc_log, names
+
+    def close(self):
+        self._file.close()
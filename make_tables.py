@@ -0,0 +1,112 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from data_utils import load_registry
+from results import (MODEL_TITLES, average_table, find_results, mode_table, read_table, sam_setting, setting_table,
+                     step_table, write_table)
+from sam_model import VARIANTS
+from instrument import LOG_LEVELS, setup_logging
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Tables of experimental_results_tables/ from the result store
+#   v1 runs, one table per model and setting:
+#     fig34-Table_for_<model>[_refine][_oracle][_scoreN]_point_number_changes.csv
+#   their column means:
+#     fig4-Table_average_overalldatasets_point_numer_changes.csv
+#   v2 runs, with and without oracle:
+#     Fig2-Performance of SAM for 5 modes of Use.csv
+#   images/s and IoU of every SAM setting (--sam-variant, --precision), if
+#   there is more than one:
+#     variants-Table_images_per_s_vs_iou.csv
+# With --reference, every table is compared to the table of the same name
+# there, on the rows and columns both have.
+####################################################
+
+MODEL_FILES = {'sam': 'sam', 'ritm': 'ritm', 'sc': 'simpleclick', 'fc': 'focalclick', 'fake': 'fake'}
+
+# (file name part, title) of the table of a v1 run
+def v1_table_name(info):
+    name, title = MODEL_FILES.get(info['model'], info['model']), MODEL_TITLES.get(info['model'], info['model'])
+    if info.get('sam_variant'):
+        name, title = name + '_' + info['sam_variant'], title + ' ' + info['sam_variant']
+    if info.get('refine'):
+        name, title = name + '_refine', title + ' refine'
+    if info.get('oracle'):
+        name, title = name + '_oracle', title + ' (oracle)'
+    if info.get('score_res'):
+        name, title = name + '_score%d' % info['score_res'], title + ' score%d' % info['score_res']
+    if info.get('precision'):
+        name, title = name + '_' + info['precision'], title + ' ' + info['precision']
+    return name, title
+
+def make_tables(results_list, registry):
+    tables = {}
+    v1_groups = {}
+    for results in results_list:
+        if results.get('protocol') == 'v1':
+            v1_groups.setdefault(v1_table_name(results), []).append(results)
+    # Models in the order of the paper's tables, oracle after plain
+    order = list(MODEL_FILES)
+    step_tables = {}
+    for (name, title), group in sorted(v1_groups.items(), key=lambda item: (order.index(item[1][0]['model'])
+                                                                             if item[1][0]['model'] in order
+                                                                             else len(order), item[0])):
+        step_tables[title] = step_table(group, registry)
+        tables['fig34-Table_for_%s_point_number_changes.csv' % name] = step_tables[title]
+    if step_tables:
+        tables['fig4-Table_average_overalldatasets_point_numer_changes.csv'] = average_table(step_tables)
+
+    # Fig2 is the paper's SAM at full resolution and precision
+    v2 = [results for results in results_list if results.get('protocol') == 'v2' and not results.get('score_res')
+          and sam_setting(results) == 'vit_h']
+    if v2:
+        plain = [results for results in v2 if not results.get('oracle')]
+        oracle = [results for results in v2 if results.get('oracle')]
+        tables['Fig2-Performance of SAM for 5 modes of Use.csv'] = mode_table(plain, oracle, registry)
+
+    if len({sam_setting(results) for results in results_list if 'protocol' in results}) > 1:
+        tables['variants-Table_images_per_s_vs_iou.csv'] = setting_table(results_list, registry, list(VARIANTS))
+    return tables
+
+# Largest absolute difference on the rows (keyed by the first cell that is
+# not an index) and columns both tables have, and the number of values compared
+def compare_tables(table, reference):
+    def keyed(header, rows):
+        key = 1 if header[0] == '' else 0
+        return {str(row[key]): dict(zip(header, row)) for row in rows}, header[key+1:]
+    rows, columns = keyed(*table)
+    ref_rows, _ = keyed(*reference)
+    diffs = []
+    for key, row in rows.items():
+        if key not in ref_rows:
+            continue
+        for column in columns:
+            if column in ref_rows[key] and ref_rows[key][column] != '':
+                diffs.append(abs(float(row[column]) - float(ref_rows[key][column])))
+    return (max(diffs) if diffs else np.nan), len(diffs)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aggregate the result store into the tables of the paper")
+    parser.add_argument("--score-dir", default=["scores"], nargs="+", help="directories searched for result files")
+    parser.add_argument("--registry", default=None, type=str, help="dataset registry file, defaults to datasets.json")
+    parser.add_argument("--out", default="./tables", type=str, help="directory to write the tables to")
+    parser.add_argument("--reference", default=None, type=str, help="directory of tables to compare with, e.g. experimental_results_tables")
+    parser.add_argument("--log-level", default="info", choices=LOG_LEVELS)
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    results_list = find_results(args.score_dir)
+    logger.info('%s result files', len(results_list))
+    os.makedirs(args.out, exist_ok=True)
+    for name, table in make_tables(results_list, load_registry(args.registry)).items():
+        write_table(os.path.join(args.out, name), table)
+        logger.info('%s: %s rows x %s columns', name, len(table[1]), len(table[0]))
+        reference = os.path.join(args.reference, name) if args.reference else None
+        if reference and os.path.exists(reference):
+            diff, count = compare_tables(table, read_table(reference))
+            logger.info('  max abs difference to %s: %s over %s values', reference, diff, count)
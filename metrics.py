@@ -0,0 +1,107 @@
+from scipy.ndimage import binary_erosion
+
+import cv2
+import numpy as np
+
+####################################################
+# Vectorized scores of a stack of binary predictions against one GT mask
+#   The predictions (any leading shape: multimask outputs x modes x clicks)
+#   are thresholded to bool and bit-packed along the rows, so a whole stack
+#   is scored with a few passes over 1/8 of the data instead of one int64
+#   copy and several sums per mask.
+# input: preds
+#   ...xHxW array, > 0 is foreground (logits, probabilities or masks)
+# input: gt
+#   HxW binary mask
+####################################################
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    # numpy < 2.0
+    _POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    def _popcount(x):
+        return _POPCOUNT[x]
+
+def _count(packed):
+    return _popcount(packed).sum(axis=(-2, -1), dtype=np.int64)
+
+# Intersection, prediction area and GT area of each prediction
+def overlap_counts(preds, gt):
+    packed_preds = np.packbits(np.asarray(preds) > 0, axis=-1)
+    packed_gt = np.packbits(np.asarray(gt) > 0, axis=-1)
+    return _count(packed_preds & packed_gt), _count(packed_preds), _count(packed_gt)
+
+# IoU of each prediction, -1 where prediction and GT are both empty (as IOU)
+def iou_stack(preds, gt):
+    inter, area_pred, area_gt = overlap_counts(preds, gt)
+    union = area_pred + area_gt - inter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(union > 0, inter / union, -1.)
+
+def dice_stack(preds, gt):
+    inter, area_pred, area_gt = overlap_counts(preds, gt)
+    total = area_pred + area_gt
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, 2 * inter / total, -1.)
+
+# Index of the best of the stacked outputs (first one on ties). Keeps the
+# behaviour of the original oracle loop: if every IoU is 0 the last output
+# is selected.
+def oracle_index(ious):
+    ious = np.asarray(ious)
+    if ious.max() > 0:
+        return int(np.argmax(ious))
+    return len(ious) - 1
+
+# One-pixel inner boundary of a mask (or of each mask of a stack)
+def _boundary(masks):
+    structure = np.zeros((1,) * (masks.ndim - 2) + (3, 3), dtype=bool)
+    structure[..., :, 1] = structure[..., 1, :] = True
+    return masks & ~binary_erosion(masks, structure=structure, border_value=0)
+
+# Distance of every pixel to the nearest boundary pixel
+def _distance_to(boundary):
+    return cv2.distanceTransform(np.uint8(~boundary), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+####################################################
+# Boundary F-score within `tolerance` pixels and 95th percentile Hausdorff
+# distance between the boundaries of each prediction and the GT.
+# output:
+#   (bf, hd95), arrays of the stack's leading shape. bf is 0 and hd95 NaN
+#   when the prediction or the GT is empty.
+####################################################
+def boundary_scores(preds, gt, tolerance=2):
+    preds = np.asarray(preds) > 0
+    lead_shape = preds.shape[:-2]
+    preds = preds.reshape((-1,) + preds.shape[-2:])
+    gt_boundary = _boundary(np.asarray(gt) > 0)
+    gt_dist = _distance_to(gt_boundary)
+    pred_boundaries = _boundary(preds)
+
+    bf = np.zeros(len(preds))
+    hd95 = np.full(len(preds), np.nan)
+    if not gt_boundary.any():
+        return bf.reshape(lead_shape), hd95.reshape(lead_shape)
+    for i, pred_boundary in enumerate(pred_boundaries):
+        if not pred_boundary.any():
+            continue
+        # pred boundary -> GT boundary and GT boundary -> pred boundary
+        d_pred = gt_dist[pred_boundary]
+        d_gt = _distance_to(pred_boundary)[gt_boundary]
+        precision = np.mean(d_pred <= tolerance)
+        recall = np.mean(d_gt <= tolerance)
+        if precision + recall > 0:
+            bf[i] = 2 * precision * recall / (precision + recall)
+        hd95[i] = np.percentile(np.concatenate([d_pred, d_gt]), 95)
+    return bf.reshape(lead_shape), hd95.reshape(lead_shape)
+
+# All metrics of a stack at once: {'iou', 'dice', 'bf', 'hd95'}
+def score_masks(preds, gt, tolerance=2):
+    inter, area_pred, area_gt = overlap_counts(preds, gt)
+    union = area_pred + area_gt - inter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        iou = np.where(union > 0, inter / union, -1.)
+        dice = np.where(union > 0, 2 * inter / (area_pred + area_gt), -1.)
+    bf, hd95 = boundary_scores(preds, gt, tolerance)
+    return {'iou': iou, 'dice': dice, 'bf': bf, 'hd95': hd95}
@@ -0,0 +1,128 @@
+import cv2
+import numpy as np
+
+from embedding_cache import restore_predictor
+from sam_decode import decode, upscale, scored_outputs
+
+####################################################
+# Click predictors: one interface for every model of the v1 protocol
+#   set_image(input_array)
+#       input_array: HxWx3 uint8 image, as returned by load_image
+#   predict(coords, labels, gt, oracle=False, keep_all=False)
+#       coords: Nx2 XY clicks so far, labels: N labels (1 positive, 0 negative)
+#       gt: binary mask of the current class; gt/oracle/keep_all only let
+#           a backend skip outputs that will not be scored
+#       returns CxHxW logits at image size, > 0 is foreground; C is the
+#       number of outputs the backend produced for this call
+#   select(output_index)
+#       the output of the last predict() the protocol scored
+# Backends with a single output (RITM, SimpleClick, FocalClick) return
+# C=1 instead of copies of the same mask.
+# SamPredictorAdapter also takes an image already encoded by a
+# batch_encode.BatchEncoder with set_encoding(encoding).
+####################################################
+
+class SamPredictorAdapter:
+    name = 'sam'
+
+    # input: refine
+    #   Feed the low-res logits of the output selected at the previous click
+    #   back as mask_input, as in SAM's interactive use
+    # input: score_res
+    #   Oracle selection on a grid of this long side (sam_decode.scored_outputs)
+    def __init__(self, predictor, cache=None, refine=False, score_res=0):
+        self.predictor = predictor
+        self.cache = cache
+        self.refine = refine
+        self.score_res = score_res
+        self._low_res, self._outputs, self._prev_low_res = None, None, None
+
+    def set_image(self, input_array):
+        if self.cache is not None:
+            self.cache.set_image(self.predictor, input_array)
+        else:
+            self.predictor.set_image(input_array)
+
+    def set_encoding(self, encoding):
+        restore_predictor(self.predictor, encoding)
+
+    def predict(self, coords, labels, gt, oracle=False, keep_all=False):
+        # The first click of a sequence starts without mask_input
+        mask_input = self._prev_low_res if len(coords) > 1 else None
+        self._low_res, _ = decode(self.predictor, coords, labels, mask_input=mask_input)
+        self._outputs = scored_outputs(self.predictor, self._low_res, gt, oracle, keep_all, self.score_res)
+        return upscale(self.predictor, self._low_res[:, self._outputs])[0].cpu().numpy()
+
+    def select(self, output_index):
+        if self.refine:
+            self._prev_low_res = self._low_res[:, [self._outputs[output_index]]]
+
+# Clicks of the isegm predictors (RITM, SimpleClick, FocalClick)
+def _isegm_clicks(coords, labels):
+    # NOTE: needs FocalClick (or RITM) on sys.path
+    from isegm.inference.clicker import Click
+    return [Click(is_positive=bool(label), coords=(int(y), int(x)), indx=i)
+            for i, ((x, y), label) in enumerate(zip(coords, labels))]
+
+class RITMAdapter:
+    name = 'ritm'
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+
+    def set_image(self, input_array):
+        self.predictor.set_input_image(input_array)
+
+    def predict(self, coords, labels, gt, oracle=False, keep_all=False):
+        from isegm.inference.evaluation import evaluate_sample_onepass
+        # RITM returns mask, mask_prob
+        _, prob = evaluate_sample_onepass(self.predictor, _isegm_clicks(coords, labels))
+        # RITM uses 0.49 as threshold. Substract it to let 0 be the threshold
+        return (prob - 0.49)[None]
+
+    def select(self, output_index):
+        pass
+
+# SimpleClick ('sc') and FocalClick ('fc')
+class ISegmAdapter:
+    def __init__(self, predictor, name):
+        self.predictor = predictor
+        self.name = name
+        self.input_array = None
+
+    def set_image(self, input_array):
+        self.input_array = input_array
+
+    def predict(self, coords, labels, gt, oracle=False, keep_all=False):
+        from isegm.inference.evaluation import evaluate_sample_onepass
+        _, prob, _ = evaluate_sample_onepass(self.input_array, gt, self.predictor, _isegm_clicks(coords, labels),
+                                             pred_thr=0.49, iterative=False)
+        return (prob - 0.49)[None]
+
+    def select(self, output_index):
+        pass
+
+####################################################
+# Model-free backend for tests and benchmarks of the evaluation loop
+#   Output k is a disc of radius radii[k] around every click, positive
+#   clicks adding and negative clicks removing it, later clicks on top.
+####################################################
+class FakePredictor:
+    name = 'fake'
+
+    def __init__(self, radii=(8, 16, 32)):
+        self.radii = radii
+        self.shape = None
+
+    def set_image(self, input_array):
+        self.shape = input_array.shape[:2]
+
+    def predict(self, coords, labels, gt, oracle=False, keep_all=False):
+        logits = np.full((len(self.radii),) + self.shape, -1, dtype=np.float32)
+        for k, radius in enumerate(self.radii):
+            for (x, y), label in zip(coords, labels):
+                cv2.circle(logits[k], (int(x), int(y)), radius, 1 if label else -1, -1)
+        return logits
+
+    def select(self, output_index):
+        pass
@@ -0,0 +1,36 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from data_utils import load_sample
+
+####################################################
+# Background loader for the samples of a dataset
+#   Reads, decodes and fixes up (load_sample) up to `depth` samples ahead of
+#   the predictor loop on num_threads threads, so the model does not wait on
+#   the disk (or NFS) for every image. cv2/PIL decoding releases the GIL.
+# input: depth
+#   Number of samples loaded ahead, bounding the memory held by the queue.
+#   depth <= 0 loads every sample synchronously in the calling thread.
+# input: loader
+#   loader(cfg, mask_name), e.g. data_utils.load_mask when the images are
+#   not needed
+# output:
+#   (mask_name, sample) in mask_list order, sample being the result of
+#   loader (None for skipped samples)
+####################################################
+def prefetch_samples(cfg, mask_list, depth=4, num_threads=2, loader=load_sample):
+    if depth <= 0:
+        for mask_name in mask_list:
+            yield mask_name, loader(cfg, mask_name)
+        return
+
+    with ThreadPoolExecutor(num_threads) as pool:
+        pending = deque()
+        for mask_name in mask_list:
+            pending.append((mask_name, pool.submit(loader, cfg, mask_name)))
+            if len(pending) > depth:
+                name, future = pending.popleft()
+                yield name, future.result()
+        while pending:
+            name, future = pending.popleft()
+            yield name, future.result()
@@ -0,0 +1,171 @@
+from functools import lru_cache
+
+import logging
+import os
+
+import numpy as np
+
+from clicks import ClickSampler
+from data_utils import load_mask
+from prefetch import prefetch_samples
+from protocols import evaluate_classes, mode_prompts
+from sweep import unit_seed
+from instrument import stage, timer
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Precomputed prompts of a dataset
+#   The prompts only depend on the GT masks and the seeded RNG, so they can
+#   be generated once (build_prompts.py) and replayed against any model
+#   (--prompts of the evaluation scripts), which then all see the same
+#   prompts. Per protocol:
+#     v1  the first click of every class (the next clicks depend on the
+#         predictions and are still drawn during the run)
+#     v2  the prompts of the 5 modes of every class
+#   Generated in the order of the evaluation loop from the same seed, they
+#   are the prompts of a live run over the same --dataset list (for v1 with
+#   --num-prompt 1: later clicks draw from the RNG between two images).
+# Saved as <dir>/<protocol>_prompts_<dataset>.npz, one row per point or box:
+#   masks   mask names, in evaluation order
+#   mask    index in masks of the row's mask (rows are grouped by mask)
+#   cls     class index
+#   mode    v2 mode, 0 for v1
+#   coords  points (cX, cY, -1, -1), boxes (x0, y0, x1, y1)
+#   label   1 positive point, -1 box
+####################################################
+
+BOX_LABEL = -1
+# Modes given as a single box instead of kx4 boxes
+_SINGLE_BOX_MODES = (2, 4)
+
+def prompt_path(prompt_dir, protocol, dataset):
+    return os.path.join(prompt_dir, '%s_prompts_%s.npz' % (protocol, dataset))
+
+# Prompts of one mask per class index, as the protocol generates them
+def mask_prompts(protocol, input_mask, num_class):
+    prompts = {}
+    if protocol == 'v1':
+        sampler = ClickSampler(input_mask.shape[:2])
+        generate = sampler.center_point
+    else:
+        generate = mode_prompts
+    def run_class(cls, mask_cls):
+        prompts[cls] = generate(mask_cls)
+    evaluate_classes(input_mask, num_class, 1, run_class)
+    return prompts
+
+# Rows (cls, mode, coords, label) of the prompts of one mask
+def _rows(protocol, prompts):
+    rows = []
+    for cls, prompt in prompts.items():
+        if protocol == 'v1':
+            rows.append((cls, 0, (prompt[0], prompt[1], -1, -1), 1))
+            continue
+        for mode, mode_prompt in enumerate(prompt):
+            if mode_prompt.shape[-1] == 3:
+                rows += [(cls, mode, (x, y, -1, -1), label) for x, y, label in mode_prompt]
+            else:
+                rows += [(cls, mode, tuple(box), BOX_LABEL) for box in mode_prompt.reshape(-1, 4)]
+    return rows
+
+class PromptIndex:
+    def __init__(self, protocol, dataset, masks, columns):
+        self.protocol = protocol
+        self.dataset = dataset
+        self.masks = list(masks)
+        self.columns = columns
+        self._positions = {mask_name: i for i, mask_name in enumerate(self.masks)}
+        # Rows of mask i: starts[i]:starts[i+1]
+        self._starts = np.searchsorted(columns['mask'], np.arange(len(self.masks) + 1))
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __contains__(self, mask_name):
+        return mask_name in self._positions
+
+    @classmethod
+    def from_prompts(cls, protocol, dataset, mask_prompts):
+        masks, mask_col, rows = [], [], []
+        for mask_name, prompts in mask_prompts:
+            mask_rows = _rows(protocol, prompts)
+            mask_col += [len(masks)] * len(mask_rows)
+            rows += mask_rows
+            masks.append(mask_name)
+        columns = {'mask': np.array(mask_col, dtype=np.int32),
+                   'cls': np.array([row[0] for row in rows], dtype=np.int16),
+                   'mode': np.array([row[1] for row in rows], dtype=np.int8),
+                   'coords': np.array([row[2] for row in rows], dtype=np.int32).reshape(-1, 4),
+                   'label': np.array([row[3] for row in rows], dtype=np.int8)}
+        return cls(protocol, dataset, masks, columns)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            columns = {name: f[name] for name in ('mask', 'cls', 'mode', 'coords', 'label')}
+            return cls(str(f['protocol']), str(f['dataset']), f['masks'].tolist(), columns)
+
+    def save(self, path):
+        np.savez_compressed(path, protocol=self.protocol, dataset=self.dataset,
+                            masks=np.array(self.masks, dtype=str), **self.columns)
+
+    # Prompts of a mask per class index, in the form the protocols take them:
+    # v1 (cX, cY); v2 the 5 arrays of protocols.mode_prompts
+    def prompts(self, mask_name):
+        if mask_name not in self._positions:
+            raise KeyError('%s has no precomputed prompts in %s, rebuild them' % (mask_name, self.dataset))
+        i = self._positions[mask_name]
+        rows = slice(self._starts[i], self._starts[i+1])
+        cls_col, mode_col = self.columns['cls'][rows], self.columns['mode'][rows]
+        coords, labels = self.columns['coords'][rows].astype(np.int64), self.columns['label'][rows].astype(np.int64)
+
+        prompts = {}
+        for cls in np.unique(cls_col):
+            in_cls = cls_col == cls
+            if self.protocol == 'v1':
+                x, y = coords[in_cls][0, :2]
+                prompts[int(cls)] = (int(x), int(y))
+                continue
+            modes = []
+            for mode in range(5):
+                sel = in_cls & (mode_col == mode)
+                if labels[sel][0] != BOX_LABEL:
+                    modes.append(np.concatenate([coords[sel][:, :2], labels[sel][:, None]], axis=1))
+                elif mode in _SINGLE_BOX_MODES:
+                    modes.append(coords[sel][0])
+                else:
+                    modes.append(coords[sel])
+            prompts[int(cls)] = modes
+        return prompts
+
+# Generate the prompts of the masks of mask_list, in order; only the masks are read
+def build_prompts(cfg, mask_list, protocol, prefetch=4, io_threads=2):
+    def generate():
+        for mask_name, loaded in timer.iterate('load', prefetch_samples(cfg, mask_list, prefetch, io_threads,
+                                                                        loader=load_mask)):
+            if loaded is None:
+                continue
+            # Seeded per image as in the evaluation scripts
+            np.random.seed(unit_seed(cfg['name'], mask_name))
+            with stage('prompt'):
+                prompts = mask_prompts(protocol, loaded[0], cfg['num_class'])
+            timer.end_image()
+            yield mask_name, prompts
+    return PromptIndex.from_prompts(protocol, cfg['name'], generate())
+
+# Saved prompts of a dataset, loaded once per process
+@lru_cache(maxsize=None)
+def load_prompts(prompt_dir, protocol, dataset):
+    index = PromptIndex.load(prompt_path(prompt_dir, protocol, dataset))
+    if index.protocol != protocol:
+        raise ValueError('%s holds %s prompts, not %s' % (prompt_path(prompt_dir, protocol, dataset),
+                                                        index.protocol, protocol))
+    logger.info('Replaying %s prompts of %s masks of %s', protocol, len(index), dataset)
+    return index
+
+# Prompts of one mask to replay, None if no prompt directory is given
+def replay_prompts(prompt_dir, protocol, dataset, mask_name):
+    if prompt_dir is None:
+        return None
+    return load_prompts(prompt_dir, protocol, dataset).prompts(mask_name)
@@ -0,0 +1,369 @@
+import logging
+
+import cv2
+import numpy as np
+
+from metrics import iou_stack, oracle_index
+from region_profile import RegionProfile
+from data_utils import class_mask
+from sam_decode import decode, upscale, scored_outputs
+from clicks import ClickSampler
+from instrument import stage
+
+logger = logging.getLogger(__name__)
+
+# The protocols draw from the global numpy RNG, which the calling scripts seed
+# per image (per volume for the volume protocol) with sweep.unit_seed, so the
+# prompts of an image do not depend on the images evaluated before it.
+
+# Point farthest from the boundary of a binary mask, ties broken at random.
+# Full-image reference of clicks.ClickSampler.center_point, which the protocol uses
+# Ref from RITM: https://github.com/SamsungLabs/ritm_interactive_segmentation/blob/aa3bb52a77129e477599b5edfd041535bc67b259/isegm/data/points_sampler.py
+def center_point(binary_msk):
+    # Calculates the distance to the closest zero pixel for each pixel of the source image.
+    # NOTE: numpy and opencv have inverse definition of row and column
+    # NOTE: SAM and opencv have the same definition
+    padded_mask = np.uint8(np.pad(binary_msk, ((1, 1), (1, 1)), 'constant'))
+    dist_img = cv2.distanceTransform(padded_mask, distanceType=cv2.DIST_L2, maskSize=5).astype(np.float32)[1:-1, 1:-1]
+    cY, cX = np.where(dist_img==dist_img.max())
+    # NOTE: random seems to change DC by +/-1e-4
+    # Random sample one point with largest distance
+    random_idx = np.random.randint(0, len(cX))
+    return int(cX[random_idx]), int(cY[random_idx])
+
+# Pick the output to score; in oracle mode the best of the 3 outputs according to GT.
+# All outputs are scored in one pass.
+# Returns the selected binary mask, its IoU and its index in preds.
+def select_output(preds, mask_cls, oracle, verbose=False):
+    masks = np.moveaxis(preds > 0, -1, 0)
+    if oracle:
+        ious = iou_stack(masks, mask_cls)
+        if verbose:
+            for mask_slice, dc in enumerate(ious):
+                logger.debug('%s %s', mask_slice, dc)
+        max_slice = oracle_index(ious)
+        return masks[max_slice], ious[max_slice], max_slice
+    return masks[0], iou_stack(masks[0], mask_cls)[()], 0
+
+####################################################
+# v1 protocol: iterative clicks following SAM's eval protocol
+# input: predictor
+#   A click predictor (see predictors.py) with the image set
+# input: input_mask
+#   Full label mask, used to decide if a click is positive or negative
+# input: mask_cls
+#   Binary uint8 mask of the current class
+# input: sampler
+#   ClickSampler of the image size, shared between the classes of an image
+# input: first_click
+#   (cX, cY) of a precomputed first click (see prompt_index), drawn by the
+#   sampler if None
+# output:
+#   (dc_prompt_tmp, preds, preds_mask_full, prompts_full)
+#   dc_prompt_tmp: IoU after each click
+#   preds: HxWxC logits of the last click, negatives set to 0. C is 1 for
+#          single-output models, and for SAM unless oracle or keep_preds
+#   preds_mask_full: 1xHxWxC logits after each click, only if keep_preds
+#   prompts_full: (cX, cY, pos/neg) of each click
+####################################################
+def click_protocol(predictor, input_mask, mask_cls, num_prompt, oracle, keep_preds=False, sampler=None, first_click=None):
+    dc_prompt_tmp, preds_mask_full, prompts_full = [], [], []
+
+    if sampler is None:
+        sampler = ClickSampler(mask_cls.shape)
+
+    # Click history; the first n rows are the prompts of click n
+    num_clicks = max(num_prompt, 1)
+    pc = np.zeros((num_clicks, 2))
+    pl = np.zeros(num_clicks, dtype=int)
+
+    # At least the first click is always evaluated
+    for idx_p in range(num_clicks):
+        with stage('prompt'):
+            if idx_p == 0:
+                # First point: farthest from the object boundary
+                cX, cY = sampler.center_point(mask_cls) if first_click is None else first_click
+                pl[idx_p] = 1
+            else:
+                # Subsequent point: farthest from the boundary of the error region
+                cX, cY = sampler.error_point(mask_cls, preds_mask_single)
+                pl[idx_p] = 0 if np.sum(input_mask[cY][cX]) == 0 else 1
+        pc[idx_p] = (cX, cY)
+        prompts_full.append((cX,cY,pl[idx_p]))
+
+        with stage('decode'):
+            preds = predictor.predict(pc[:idx_p+1], pl[:idx_p+1], mask_cls, oracle=oracle, keep_all=keep_preds)
+
+        with stage('score'):
+            # if logit < 0, it is more like a background
+            preds[preds < 0] = 0
+            preds = preds.transpose((1,2,0))
+            preds_mask_single, dc, max_slice = select_output(preds, mask_cls, oracle, verbose=(idx_p == 0))
+        predictor.select(max_slice)
+        dc_prompt_tmp.append(dc)
+        if keep_preds:
+            preds_mask_full.append(np.expand_dims(preds, 0))
+
+    logger.debug('Final prompts %s %s', pc.astype(int).tolist(), pl.tolist())
+    return dc_prompt_tmp, preds, preds_mask_full, prompts_full
+
+# Prompts of the 5 modes: kx3 (cX, cY, 1) points for modes 0-1, a box
+# [x0, y0, x1, y1] for modes 2 and 4, kx4 boxes for mode 3
+def mode_prompts(mask_cls):
+    # Find all disconnected regions
+    profile = RegionProfile(mask_cls)
+    logger.debug('num of regions found %s', profile.num)
+    if logger.isEnabledFor(logging.DEBUG):
+        mask_area = np.sum(profile.areas)
+        for region_id in range(1, profile.num+1):
+            logger.debug('curr mask over all mask ratio %s', profile.area(region_id) / mask_area)
+    regionid_list = profile.regions_by_area()
+
+    # 5 modes for now
+    prompts = []
+    for mode in range(5):
+        # Mode 0: middle point of LARGEST mask
+        if mode == 0:
+            cX, cY = profile.center_point(regionid_list[0])
+            prompt = [(cX,cY,1)]
+        # Mode 1: middle point of top-3 LARGEST mask
+        if mode == 1:
+            prompt = []
+            for mask_idx in range(3):
+                if mask_idx < len(regionid_list):
+                    cX, cY = profile.center_point(regionid_list[mask_idx])
+                    prompt.append((cX,cY,1))
+        # Mode 2: box of LARGEST mask
+        if mode == 2:
+            prompt = profile.bbox(regionid_list[0])
+        # Mode 3: box of top-3 LARGEST mask
+        if mode == 3:
+            prompt = []
+            for mask_idx in range(3):
+                if mask_idx < len(regionid_list):
+                    prompt.append(profile.bbox(regionid_list[mask_idx]))
+        # Mode 4: box of ENTIRE mask
+        if mode == 4:
+            prompt = profile.bbox_all()
+        prompts.append(np.array(prompt))
+    return prompts
+
+####################################################
+# v2 protocol: 5 modes of prompts
+#   Mode 0: 1 point at the center of the LARGEST component
+#   Mode 1: 1 point at the center of each of the top-3 LARGEST components
+#   Mode 2: 1 box around the LARGEST component
+#   Mode 3: 1 box around each of the top-3 LARGEST components
+#   Mode 4: 1 box around the ENTIRE mask
+# input: mask_cls
+#   Binary uint8 mask of the current class
+# input: prompts
+#   The 5 prompts of mode_prompts(mask_cls), e.g. precomputed (see
+#   prompt_index); generated here if None
+# input: batch_boxes
+#   Decode the boxes of modes 2-4 in a single mask decoder pass instead of
+#   one predictor.predict call per box
+# input: score_res
+#   Oracle selection on a grid of this long side (see scored_outputs)
+# output:
+#   (dc_prompt_tmp, preds_mask_full, prompts_full), IoU of each mode and,
+#   if keep_preds, the HxWx3 predictions and prompts of each mode
+####################################################
+def mode_protocol(predictor, mask_cls, oracle, keep_preds=False, batch_boxes=True, score_res=0, prompts=None):
+    dc_prompt_tmp, preds_mask_full, prompts_full = [], [], []
+
+    if prompts is None:
+        with stage('prompt'):
+            prompts = mode_prompts(mask_cls)
+
+    # Modes 2-4 are all plain boxes: decode them in one mask decoder pass
+    # (mode 3 is the union of its per-component masks, as in the loop below)
+    low_res = {}
+    if batch_boxes:
+        boxes = np.concatenate([prompts[2][None], prompts[3], prompts[4][None]])
+        with stage('decode'):
+            box_low_res, _ = decode(predictor, boxes=boxes)
+        low_res[2], low_res[3], low_res[4] = box_low_res[:1], box_low_res[1:-1], box_low_res[-1:]
+
+    for mode, prompt in enumerate(prompts):
+        # Get output based on prompt type
+        logger.debug('mode %s: prompt: %s', mode, prompt)
+        with stage('decode'):
+            if prompt.shape[-1] == 3:
+                pc = prompt[:,:2]
+                pl = prompt[:, -1]
+                low_res[mode], _ = decode(predictor, pc, pl)
+            if mode in low_res:
+                # Only the outputs that are scored are upscaled
+                outputs = scored_outputs(predictor, low_res[mode], mask_cls, oracle, keep_preds, score_res)
+                masks = upscale(predictor, low_res[mode][:, outputs]) > predictor.model.mask_threshold
+                preds = masks.any(0).cpu().numpy()
+            elif prompt.shape[-1] == 4:
+                if len(prompt.shape) == 1:
+                    preds, _, _ = predictor.predict(box=prompt)
+                else:
+                    preds = None
+                    for box in prompt:
+                        preds_single, _, _ = predictor.predict(box=box)
+                        if preds is None:
+                            preds = preds_single
+                        else:
+                            preds += preds_single
+
+        with stage('score'):
+            preds = preds.transpose((1,2,0))
+            _, dc, _ = select_output(preds, mask_cls, oracle, verbose=True)
+        dc_prompt_tmp.append(dc)
+        logger.debug('IoU: %s', dc)
+
+        # Track prediction, only used when vis
+        if keep_preds:
+            preds_mask_full.append(np.expand_dims(preds, 0))
+            prompts_full.append(prompt)
+
+    return dc_prompt_tmp, preds_mask_full, prompts_full
+
+####################################################
+# Volume protocol: one decoder call per slice and class
+#   A click at the center of the class on the slice (as the first v1 click),
+#   with the low-res logits selected on the previous slice of the volume as
+#   mask_input, so the object is carried from slice to slice instead of being
+#   segmented from scratch with num_prompt clicks.
+# input: prev_low_res
+#   1x1x256x256 logits selected on the previous slice for this class, or None
+# output:
+#   (mask, dc, low_res, click): selected HxW mask, its IoU, its 1x1x256x256
+#   logits and the (x, y) click
+####################################################
+def propagation_step(predictor, mask_cls, prev_low_res, oracle, sampler, score_res=0):
+    with stage('prompt'):
+        cX, cY = sampler.center_point(mask_cls)
+    with stage('decode'):
+        low_res, _ = decode(predictor, np.array([[cX, cY]]), np.array([1]), mask_input=prev_low_res)
+        outputs = scored_outputs(predictor, low_res, mask_cls, oracle, score_res=score_res)
+        preds = upscale(predictor, low_res[:, outputs])[0].cpu().numpy()
+    with stage('score'):
+        mask, dc, max_slice = select_output(preds.transpose((1,2,0)), mask_cls, oracle)
+    return mask, dc, low_res[:, [outputs[max_slice]]], (cX, cY)
+
+# Carried-over prompt on a slice where the class is absent: the click of the
+# last slice that had it and the logits selected on the previous slice.
+# All it predicts is false positive; the oracle picks the output of the
+# smallest area (there is no IoU to maximise against an empty mask).
+# output:
+#   (mask, low_res): HxW mask and its 1x1x256x256 logits
+def carry_step(predictor, click, prev_low_res, oracle):
+    with stage('decode'):
+        low_res, _ = decode(predictor, np.array([click]), np.array([1]), mask_input=prev_low_res)
+        outputs = list(range(low_res.shape[1])) if oracle else [0]
+        masks = (upscale(predictor, low_res[:, outputs])[0] > 0).cpu().numpy()
+    with stage('score'):
+        index = int(np.argmin(masks.reshape(len(outputs), -1).sum(1)))
+    return masks[index], low_res[:, [outputs[index]]]
+
+# Class loop shared by both protocols. run_class(cls, mask_cls) returns the
+# scores of one class; absent classes get NaN placeholders of num_scores entries.
+def evaluate_classes(input_mask, num_class, num_scores, run_class):
+    dc_class_tmp = []
+    for cls in range(num_class):
+        logger.debug('Predicting class %s', cls)
+        # segment current class as binary segmentation
+        mask_cls = class_mask(input_mask, num_class, cls)
+        if not mask_cls.any():
+            logger.debug('Empty single cls, skipped')
+            if num_class == 1:
+                dc_class_tmp.append(np.nan)
+            else:
+                dc_class_tmp.append([np.nan] * num_scores)
+            continue
+
+        dc_class_tmp.append(run_class(cls, mask_cls))
+    return dc_class_tmp
+
+####################################################
+# Per-image entry points; the image must already be set on the predictor
+# (a click predictor of predictors.py for v1, a SamPredictor for v2)
+# output:
+#   (dc_class_tmp, vis_data)
+#   dc_class_tmp: scores of each class, as stored in dc_log
+#   vis_data: predictions/prompts kept for VIS mode, None if keep_preds is False
+# prompts: precomputed prompts of the image per class index (see
+# prompt_index), the first click for v1 and the 5 mode prompts for v2
+####################################################
+def click_protocol_image(predictor, input_array, input_mask, num_class, num_prompt, oracle, keep_preds=False, prompts=None):
+    vis_data = {}
+    sampler = ClickSampler(input_mask.shape[:2])
+    def run_class(cls, mask_cls):
+        # ------ Generate prompt by SAM's eval protocol -------#
+        dc_prompt_tmp, preds, preds_mask_full, prompts_full = click_protocol(
+            predictor, input_mask, mask_cls, num_prompt, oracle, keep_preds=keep_preds, sampler=sampler,
+            first_click=None if prompts is None else prompts[cls])
+        # assgin final mask for this class to it
+        logger.debug('Predicted DC %s', dc_prompt_tmp[-1])
+        if keep_preds:
+            # Only the last predicted class is kept
+            vis_data['preds_mask_full'] = preds_mask_full
+            vis_data['prompts_full'] = prompts_full
+            vis_data['gt_mask_full'] = [np.expand_dims(mask_cls, 0)] * len(prompts_full)
+            vis_data['input_full'] = [input_array] * len(prompts_full)
+        return dc_prompt_tmp
+
+    dc_class_tmp = evaluate_classes(input_mask, num_class, num_prompt, run_class)
+    return dc_class_tmp, (vis_data if keep_preds else None)
+
+def mode_protocol_image(predictor, input_mask, num_class, oracle, keep_preds=False, batch_boxes=True, score_res=0,
+                        prompts=None):
+    vis_data = {}
+    def run_class(cls, mask_cls):
+        # ------ Generate prompt by our definition -------- #
+        dc_prompt_tmp, preds_mask_full, prompts_full = mode_protocol(predictor, mask_cls, oracle, keep_preds=keep_preds,
+                                                                  batch_boxes=batch_boxes, score_res=score_res,
+                                                                  prompts=None if prompts is None else prompts[cls])
+        # Only the last predicted class is kept
+        vis_data['preds_mask_full'] = preds_mask_full
+        vis_data['prompts_full'] = prompts_full
+        return dc_prompt_tmp
+
+    # Fixed with 5 modes for now
+    dc_class_tmp = evaluate_classes(input_mask, num_class, 5, run_class)
+    return dc_class_tmp, (vis_data if keep_preds else None)
+
+# Bounds of the carry past the end of an object: number of slices without
+# the class, and predicted area relative to the object on its last slice
+CARRY_SLICES = 2
+CARRY_AREA = 0.1
+
+# One slice of a volume; the image must already be set on the SamPredictor.
+# state maps each class to (click, logits, object area, slices carried) of
+# the previous slice and is updated in place. A class absent from this slice
+# but carried from the previous one is still decoded from the carried-over
+# prompt (carry_step) and its predicted area counts as false positive, so a
+# prediction leaking past the end of an object lowers the 3D IoU. A stale
+# positive click hardly ever predicts an empty mask, so the carry stops after
+# carry_slices slices, or once the prediction falls below carry_area times
+# the object's last area; the class then restarts without mask_input.
+def volume_protocol_image(predictor, input_mask, num_class, oracle, state, scores, score_res=0,
+                          carry_slices=CARRY_SLICES, carry_area=CARRY_AREA):
+    sampler = ClickSampler(input_mask.shape[:2])
+    predicted = set()
+    def run_class(cls, mask_cls):
+        prev_low_res = state[cls][1] if cls in state else None
+        mask, dc, low_res, click = propagation_step(predictor, mask_cls, prev_low_res, oracle, sampler, score_res)
+        state[cls] = (click, low_res, np.count_nonzero(mask_cls), 0)
+        scores.add(cls, mask, mask_cls)
+        scores.decoder_calls += 1
+        predicted.add(cls)
+        return dc
+
+    dc_class_tmp = evaluate_classes(input_mask, num_class, 1, run_class)
+    for cls in sorted(set(state) - predicted):
+        click, prev_low_res, area, carried = state.pop(cls)
+        if carried >= carry_slices:
+            continue
+        mask, low_res = carry_step(predictor, click, prev_low_res, oracle)
+        scores.add_absent(cls, mask)
+        scores.decoder_calls += 1
+        if carried + 1 < carry_slices and np.count_nonzero(mask) >= carry_area * area:
+            state[cls] = (click, low_res, area, carried + 1)
+    scores.slices += 1
+    return dc_class_tmp
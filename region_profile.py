@@ -0,0 +1,90 @@
+from scipy.ndimage import find_objects
+from skimage.measure import label
+
+import cv2
+import numpy as np
+
+####################################################
+# Connected-component profile of a mask, computed once and shared by all
+# prompt modes instead of scanning the full mask once per region.
+# input: mask
+#   A mask should containing no 'void' class. Components are labelled
+#   exactly as skimage.measure.label(mask, connectivity=2), so region ids
+#   (and therefore tie-breaking between equally large regions) are unchanged.
+# Per region (ids 1..num) it provides:
+#   area, bbox [x0,y0,x1,y1] (inclusive, XYXY like MaskToBoxSimple),
+#   centroid (x, y), class of the region, and the region cropped to its bbox
+####################################################
+class RegionProfile:
+    def __init__(self, mask):
+        self.mask = mask
+        self.label_msk, self.num = label(mask, connectivity=2, return_num=True)
+        self.areas = np.bincount(self.label_msk.ravel(), minlength=self.num+1)[1:]
+        # slices[i-1] = (rows, cols) of region i
+        self.slices = find_objects(self.label_msk, max_label=self.num)
+        self._centroids = None
+
+    def __len__(self):
+        return self.num
+
+    def area(self, region_id):
+        return self.areas[region_id-1]
+
+    def bbox(self, region_id):
+        rows, cols = self.slices[region_id-1]
+        return [cols.start, rows.start, cols.stop-1, rows.stop-1]
+
+    # Box around every region, same as MaskToBoxSimple(mask)
+    def bbox_all(self):
+        boxes = np.array([self.bbox(i) for i in range(1, self.num+1)])
+        return [boxes[:,0].min(), boxes[:,1].min(), boxes[:,2].max(), boxes[:,3].max()]
+
+    # Binary uint8 crop of the region, padded by pad zero pixels,
+    # and the (row, col) of the crop's top-left corner in the full mask
+    def crop(self, region_id, pad=0):
+        rows, cols = self.slices[region_id-1]
+        crop = np.uint8(self.label_msk[rows, cols] == region_id)
+        if pad:
+            crop = np.pad(crop, ((pad, pad), (pad, pad)), 'constant')
+        return crop, (rows.start-pad, cols.start-pad)
+
+    # Full-size binary mask of the region
+    def region_mask(self, region_id):
+        return np.where(self.label_msk==region_id, 1, 0)
+
+    # First pixel of the region in raster order, as (row, col)
+    def first_pixel(self, region_id):
+        crop, (y0, x0) = self.crop(region_id)
+        r, c = np.unravel_index(np.argmax(crop), crop.shape)
+        return y0 + r, x0 + c
+
+    def region_class(self, region_id):
+        return self.mask[self.first_pixel(region_id)]
+
+    # (x, y) centroid of each region, Nx2
+    def centroids(self):
+        if self._centroids is None:
+            self._centroids = np.zeros((self.num, 2))
+            for i in range(1, self.num+1):
+                crop, (y0, x0) = self.crop(i)
+                rows, cols = np.nonzero(crop)
+                self._centroids[i-1] = (x0 + cols.mean(), y0 + rows.mean())
+        return self._centroids
+
+    # Region ids from the largest to the smallest; equal areas are ordered by
+    # decreasing id, as the reversed sorted(zip(ratio_list, regionid_list)) did
+    def regions_by_area(self):
+        return sorted(range(1, self.num+1), key=lambda i: (self.areas[i-1], i), reverse=True)
+
+    # Point farthest from the region boundary, ties broken at random.
+    # The distance transform only runs on the bbox crop plus a 1 pixel border:
+    # the border is background, and no pixel outside it can be closer to a
+    # pixel of the region, so the distances (and argmax order) are the same
+    # as on the full mask.
+    def center_point(self, region_id):
+        padded_mask, (y0, x0) = self.crop(region_id, pad=1)
+        dist_img = cv2.distanceTransform(padded_mask, distanceType=cv2.DIST_L2, maskSize=5).astype(np.float32)[1:-1, 1:-1]
+        cY, cX = np.where(dist_img==dist_img.max())
+        random_idx = np.random.randint(0, len(cX))
+        # crop was padded by 1 and dist_img un-padded, so the offset is y0+1, x0+1
+        return int(cX[random_idx]) + x0 + 1, int(cY[random_idx]) + y0 + 1
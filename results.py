@@ -0,0 +1,269 @@
+import csv
+import glob
+import json
+import os
+import warnings
+
+import numpy as np
+
+####################################################
+# Columnar result store
+#   One compressed file per run and dataset,
+#   <score_dir>/<version>_results_<dataset>.npz, with a fixed schema:
+#     names   image names, N
+#     scores  float64 N x num_class x num_steps IoU: steps are the clicks
+#             (v1), the 5 modes (v2) or the volume (1); NaN where a class
+#             is absent, whatever placeholder the protocol used
+#     info    JSON: dataset, version and the run settings (run_info of the
+#             scripts: protocol, model, oracle, ...)
+# The aggregation below rebuilds the tables of experimental_results_tables/
+# from these files (make_tables.py).
+####################################################
+
+def results_path(score_dir, version, dataset):
+    return os.path.join(score_dir, '%s_results_%s.npz' % (version, dataset))
+
+# dc_log (per sample: per class a list of step scores, or a scalar) as a
+# dense N x num_class x num_steps array
+def scores_array(dc_log):
+    samples = [[np.atleast_1d(np.asarray(cls_scores, dtype=np.float64)) for cls_scores in dc_class_tmp]
+               for dc_class_tmp in dc_log]
+    num_class = max((len(classes) for classes in samples), default=0)
+    num_steps = max((len(steps) for classes in samples for steps in classes), default=0)
+    scores = np.full((len(samples), num_class, num_steps), np.nan)
+    for i, classes in enumerate(samples):
+        for cls, steps in enumerate(classes):
+            scores[i, cls, :len(steps)] = steps
+    return scores
+
+def save_results(score_dir, version, dataset, dc_log, names, info=None):
+    scores = scores_array(dc_log)
+    info = dict(info or {}, dataset=dataset, version=version)
+    np.savez_compressed(results_path(score_dir, version, dataset), names=np.array(names, dtype=str),
+                        scores=scores, info=json.dumps(info))
+    return scores
+
+def load_results(path):
+    with np.load(path) as f:
+        info = json.loads(str(f['info']))
+        return dict(info, names=f['names'].tolist(), scores=f['scores'], path=path)
+
+# Every result file under the score directories
+def find_results(score_dirs):
+    paths = []
+    for score_dir in score_dirs:
+        paths += glob.glob(os.path.join(score_dir, '**', '*_results_*.npz'), recursive=True)
+    return [load_results(path) for path in sorted(paths)]
+
+####################################################
+# Bit-packed masks (VIS mode)
+#   Binary masks of any shape, packed 8 pixels per byte: the HxW logits
+#   stacks of VIS mode only need their sign, at 1/32 of float32's size.
+####################################################
+def pack_masks(masks):
+    masks = np.asarray(masks, dtype=bool)
+    return np.packbits(masks.ravel()), masks.shape
+
+def unpack_masks(bits, shape):
+    return np.unpackbits(bits, count=int(np.prod(shape))).reshape(shape).astype(bool)
+
+# One compressed file per image: <save_path>/<stem>_vis.npz with the packed
+# predictions (logits > 0) and GT, and the prompts (a list: the v2 modes
+# differ in shape). The input image is not copied, it is read again from
+# im_name.
+def save_vis(save_path, im_name, preds, prompts, gt=None):
+    os.makedirs(save_path, exist_ok=True)
+    arrays = {'im_name': im_name, 'num_prompts': len(prompts)}
+    for i, prompt in enumerate(prompts):
+        arrays['prompt_%d' % i] = np.asarray(prompt)
+    arrays['pred_bits'], arrays['pred_shape'] = pack_masks(preds > 0)
+    if gt is not None:
+        arrays['gt_bits'], arrays['gt_shape'] = pack_masks(gt)
+    np.savez_compressed(os.path.join(save_path, '%s_vis.npz' % os.path.splitext(im_name)[0]), **arrays)
+
+def load_vis(path):
+    with np.load(path) as f:
+        vis = {'im_name': str(f['im_name']), 'prompts': [f['prompt_%d' % i] for i in range(int(f['num_prompts']))],
+               'preds': unpack_masks(f['pred_bits'], f['pred_shape'])}
+        if 'gt_bits' in f:
+            vis['gt'] = unpack_masks(f['gt_bits'], f['gt_shape'])
+    return vis
+
+####################################################
+# Aggregation into the tables of experimental_results_tables/
+#   A column is a (dataset, class), titled by the 'labels' of the registry
+#   (e.g. 'CT-Organ: Lung'). Its value at a step is the mean IoU over the
+#   images where the class is present.
+#   step_table     fig34: mean IoU after 1..num_steps clicks, per column
+#   average_table  fig4: mean of the columns of step tables, per model
+#   mode_table     Fig2: mean IoU of the 5 modes per column, with and
+#                  without oracle
+# Tables are (header, rows), rows in registry order of the datasets.
+####################################################
+
+MODE_TITLES = ['Mode 1: 1 point at largest object region', 'Mode 2: 1 point at each object region',
+               'Mode 3: 1 box at largest object region', 'Mode 4: 1 box at each object region',
+               'Mode 5: 1 box cover all objects']
+
+MODEL_TITLES = {'sam': 'SAM', 'ritm': 'RITM', 'sc': 'SimpleClick', 'fc': 'FocalClick', 'fake': 'Fake'}
+
+def class_labels(dataset, num_class, registry):
+    labels = registry['datasets'].get(dataset, {}).get('labels')
+    if labels is not None and len(labels) >= num_class:
+        return labels[:num_class]
+    if num_class == 1:
+        return [dataset]
+    return ['%s: %d' % (dataset, cls + 1) for cls in range(num_class)]
+
+# (label, num_steps mean IoUs) of every class of the results, datasets in registry order
+def class_means(results_list, registry):
+    order = list(registry['datasets'])
+    results_list = sorted(results_list, key=lambda r: (order.index(r['dataset']) if r['dataset'] in order
+                                                       else len(order), r['dataset']))
+    columns = []
+    for results in results_list:
+        scores = results['scores']
+        with warnings.catch_warnings():
+            # Classes absent from every image: NaN, without the empty slice warning
+            warnings.simplefilter('ignore', RuntimeWarning)
+            means = np.nanmean(scores, axis=0)
+        for label, mean in zip(class_labels(results['dataset'], scores.shape[1], registry), means):
+            columns.append((label, mean))
+    return columns
+
+def step_table(results_list, registry):
+    columns = class_means(results_list, registry)
+    num_steps = max((len(mean) for _, mean in columns), default=0)
+    header = ['Num of points'] + [label for label, _ in columns]
+    rows = [[step + 1] + [float(mean[step]) if step < len(mean) else np.nan for _, mean in columns]
+            for step in range(num_steps)]
+    return header, rows
+
+# tables: {title: step table}, averaged over their columns at every step
+def average_table(tables):
+    titles = list(tables)
+    num_steps = max((len(rows) for _, rows in tables.values()), default=0)
+    rows = []
+    for step in range(num_steps):
+        row = [step + 1]
+        for title in titles:
+            _, table_rows = tables[title]
+            row.append(float(np.nanmean(np.asarray(table_rows[step][1:], dtype=float)))
+                       if step < len(table_rows) else np.nan)
+        rows.append(row)
+    return ['Num of points'] + titles, rows
+
+def mode_table(plain, oracle, registry):
+    plain, oracle = dict(class_means(plain, registry)), dict(class_means(oracle, registry))
+    labels = list(plain) + [label for label in oracle if label not in plain]
+    header = ['', 'Dataset_names']
+    for title in MODE_TITLES:
+        header += [title, title.replace(':', ' (oracle):', 1)]
+    rows = []
+    for i, label in enumerate(labels):
+        row = [i, label]
+        for mode in range(len(MODE_TITLES)):
+            for means in (plain, oracle):
+                row.append(float(means[label][mode]) if label in means else np.nan)
+        rows.append(row)
+    return header, rows
+
+####################################################
+# Speed vs accuracy of the SAM settings (backbone variant and precision)
+#   The SAM runs of the same experiment (protocol, clicks, oracle, ...) on a
+#   dataset, one pair of columns per setting: images/s, from the timing
+#   summary saved next to the result file, and the mean IoU after the last
+#   click (v1) or over the modes (v2) / volumes. The 'all' row of an
+#   experiment pools the images and time of its datasets and averages their
+#   IoUs.
+####################################################
+
+def sam_setting(info):
+    setting = info.get('sam_variant', 'vit_h')
+    if info.get('precision'):
+        setting += ' ' + info['precision']
+    return setting
+
+def experiment_name(info):
+    name = info['protocol']
+    if info['protocol'] == 'v1':
+        name += ' %s prompts' % info['num_prompt']
+    for key in ('refine', 'oracle'):
+        if info.get(key):
+            name += ' ' + key
+    if info.get('score_res'):
+        name += ' score%d' % info['score_res']
+    return name
+
+# Timing summary (instrument.write_summary) of a result file, None if missing
+def load_timing(results):
+    path = results['path'].replace('_results_', '_timing_')
+    path = os.path.splitext(path)[0] + '.json'
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def final_iou(results):
+    scores = results['scores']
+    if results['protocol'] == 'v1':
+        scores = scores[..., -1:]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return float(np.nanmean(scores)) if scores.size else np.nan
+
+def setting_table(results_list, registry, settings_order=()):
+    sam = [results for results in results_list if results.get('protocol') in ('v2', 'volume') or
+           (results.get('protocol') == 'v1' and results.get('model') == 'sam')]
+    # Variants in settings_order, then by precision
+    variants = list(settings_order)
+    settings = sorted({sam_setting(results) for results in sam},
+                      key=lambda setting: (variants.index(setting.split()[0]) if setting.split()[0] in variants
+                                           else len(variants), setting))
+    order = list(registry['datasets'])
+    cells = {}
+    for results in sam:
+        timing = load_timing(results) or {}
+        cells.setdefault((experiment_name(results), results['dataset']), {})[sam_setting(results)] = \
+            (timing.get('images', 0), timing.get('elapsed_s', 0.0), final_iou(results))
+    header = ['Experiment', 'Dataset']
+    for setting in settings:
+        header += ['%s images/s' % setting, '%s IoU' % setting]
+
+    def row(experiment, dataset, values):
+        row = [experiment, dataset]
+        for setting in settings:
+            images, elapsed, iou = values.get(setting, (0, 0.0, np.nan))
+            row += [images / elapsed if elapsed > 0 else np.nan, iou]
+        return row
+
+    rows = []
+    for experiment in sorted({experiment for experiment, _ in cells}):
+        datasets = sorted((dataset for exp, dataset in cells if exp == experiment),
+                          key=lambda dataset: (order.index(dataset) if dataset in order else len(order), dataset))
+        pooled = {}
+        for dataset in datasets:
+            values = cells[experiment, dataset]
+            rows.append(row(experiment, dataset, values))
+            for setting, (images, elapsed, iou) in values.items():
+                pooled.setdefault(setting, []).append((images, elapsed, iou))
+        total = {}
+        for setting, values in pooled.items():
+            images, elapsed, ious = zip(*values)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                total[setting] = (sum(images), sum(elapsed), float(np.nanmean(ious)))
+        rows.append(row(experiment, 'all', total))
+    return header, rows
+
+def read_table(path):
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+def write_table(path, table):
+    header, rows = table
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
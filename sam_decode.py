@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+
+from metrics import iou_stack, oracle_index
+
+####################################################
+# Batched decoding helpers on top of SamPredictor
+# All of them expect the image to be already set on the predictor and take
+# prompts in original image coordinates, like SamPredictor.predict.
+# Decoding (prompt encoder + mask decoder) and upscaling the 256x256 low-res
+# logits are separate steps, so that callers only pay for upscaling the
+# outputs they actually score.
+# torch is imported on first use: it is loaded with the model anyway, and
+# the model-free paths (prompt generation, FakePredictor) do without it.
+####################################################
+
+####################################################
+# input: point_coords, point_labels
+#   Nx2 XY clicks and their N labels (1 positive, 0 negative), a single prompt
+# input: boxes
+#   Bx4 XYXY boxes, one prompt per box
+# input: mask_input
+#   1x1x256x256 low-res logits of a previous prediction (numpy or torch), or None
+# output:
+#   (low_res_logits, iou_predictions), torch Bx3x256x256 and Bx3
+#   (Bx1 if not multimask_output), B=1 for points
+####################################################
+def decode(predictor, point_coords=None, point_labels=None, boxes=None, mask_input=None, multimask_output=True):
+    import torch
+    model = predictor.model
+    points = None
+    if point_coords is not None:
+        coords = predictor.transform.apply_coords(point_coords, predictor.original_size)
+        coords_torch = torch.as_tensor(coords, dtype=torch.float, device=predictor.device)[None]
+        labels_torch = torch.as_tensor(point_labels, dtype=torch.int, device=predictor.device)[None]
+        points = (coords_torch, labels_torch)
+    if boxes is not None:
+        boxes = predictor.transform.apply_boxes(np.asarray(boxes), predictor.original_size)
+        boxes = torch.as_tensor(boxes, dtype=torch.float, device=predictor.device)
+    if mask_input is not None:
+        mask_input = torch.as_tensor(mask_input, dtype=torch.float, device=predictor.device)
+
+    with torch.no_grad():
+        sparse_embeddings, dense_embeddings = model.prompt_encoder(points=points, boxes=boxes, masks=mask_input)
+        return model.mask_decoder(
+            image_embeddings=predictor.features,
+            image_pe=model.prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embeddings,
+            dense_prompt_embeddings=dense_embeddings,
+            multimask_output=multimask_output,
+        )
+
+# Low-res logits (BxCx256x256) to logits at the original image size, exactly
+# as SamPredictor does. With size=(h, w), the unpadded part of the low-res
+# grid is resized straight to that (smaller) size instead.
+def upscale(predictor, low_res, size=None):
+    import torch
+    with torch.no_grad():
+        if size is None:
+            return predictor.model.postprocess_masks(low_res, predictor.input_size, predictor.original_size)
+        scale = low_res.shape[-1] / predictor.model.image_encoder.img_size
+        h, w = [int(np.ceil(s * scale)) for s in predictor.input_size]
+        return torch.nn.functional.interpolate(low_res[..., :h, :w], tuple(size), mode='bilinear', align_corners=False)
+
+# (h, w) with the long side of the original image shrunk to score_res
+def score_size(original_size, score_res):
+    scale = min(1.0, score_res / max(original_size))
+    return tuple(max(1, int(round(s * scale))) for s in original_size)
+
+####################################################
+# Outputs of a decoded SAM prompt that need to be upscaled to full size
+#   low_res: Bx3x256x256 logits of B prompts scored together (B>1: union of
+#   their masks). Without oracle only output 0 is scored. In oracle mode all
+#   3 are, unless score_res is given: the oracle then picks the output on a
+#   grid whose long side is score_res and only that output is upscaled.
+#   keep_all (vis) always keeps the 3 outputs.
+####################################################
+def scored_outputs(predictor, low_res, mask_cls, oracle, keep_all=False, score_res=0):
+    if keep_all or (oracle and not score_res):
+        return list(range(low_res.shape[1]))
+    if not oracle:
+        return [0]
+    size = score_size(predictor.original_size, score_res)
+    small_preds = (upscale(predictor, low_res, size) > 0).any(0).cpu().numpy()
+    small_gt = cv2.resize(mask_cls, size[::-1], interpolation=cv2.INTER_NEAREST)
+    return [oracle_index(iou_stack(small_preds, small_gt))]
+
+# input: boxes
+#   Nx4 array of XYXY boxes
+# output:
+#   NxCxHxW bool masks at original image size, C=3 if multimask_output
+def predict_boxes(predictor, boxes, multimask_output=True):
+    low_res, _ = decode(predictor, boxes=boxes, multimask_output=multimask_output)
+    return (upscale(predictor, low_res) > predictor.model.mask_threshold).cpu().numpy()
@@ -0,0 +1,116 @@
+import glob
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# SAM for inference on a device and at a precision of its image encoder
+#   fp32  the checkpoint as is
+#   bf16  the image encoder runs under torch.autocast with bfloat16; its
+#         features are cast back to float32, so the embedding cache, the
+#         prompt encoder and the mask decoder are unchanged
+#   int8  the nn.Linear layers of the image encoder (attention qkv/proj and
+#         MLP, nearly all of the ViT's work) are dynamically quantized to
+#         int8; torch only has CPU kernels for them
+# The prompt encoder and mask decoder stay in fp32: they are cheap, and the
+# scores are thresholded on their logits.
+# Embeddings depend on the precision: checkpoint_id(..., precision) keeps
+# the cache entries of each precision apart.
+####################################################
+
+PRECISIONS = ['fp32', 'bf16', 'int8']
+
+####################################################
+# Backbone variants: --sam-variant -> (package, registry key, checkpoint
+# file, download URL)
+#   vit_h is the paper's model, under its "default" registry key so that
+#   the embedding cache ids of earlier runs stay valid. mobile_sam is
+#   MobileSAM's distilled TinyViT encoder with SAM's decoder, from its own
+#   segment_anything-compatible package (pip install mobile_sam).
+# Scores of a variant other than vit_h are saved as sam_<variant>_...
+# instead of sam_... (sam_name).
+####################################################
+VARIANTS = {
+    'vit_h': ('segment_anything', 'default', 'sam_vit_h_4b8939.pth',
+              'https://dl.fbaipublicfiles.com/segment_anything/sam_vit_h_4b8939.pth'),
+    'vit_l': ('segment_anything', 'vit_l', 'sam_vit_l_0b3195.pth',
+              'https://dl.fbaipublicfiles.com/segment_anything/sam_vit_l_0b3195.pth'),
+    'vit_b': ('segment_anything', 'vit_b', 'sam_vit_b_01ec64.pth',
+              'https://dl.fbaipublicfiles.com/segment_anything/sam_vit_b_01ec64.pth'),
+    'mobile_sam': ('mobile_sam', 'vit_t', 'mobile_sam.pt',
+                   'https://github.com/ChaoningZhang/MobileSAM/raw/master/weights/mobile_sam.pt'),
+}
+
+def sam_name(variant):
+    return 'sam' if variant == 'vit_h' else 'sam_' + variant
+
+def model_type(variant):
+    return VARIANTS[variant][1]
+
+####################################################
+# Checkpoint of a variant
+#   An explicit checkpoint is used as is. Otherwise the variant's file in
+#   model_path, or else the one file there of the same backbone under
+#   another hash (e.g. sam_vit_b_*.pth). If there is none, the expected
+#   path is returned and the download URL logged; loading it then fails.
+####################################################
+def resolve_checkpoint(model_path, variant, checkpoint=None):
+    if checkpoint is not None:
+        return checkpoint
+    _, _, filename, url = VARIANTS[variant]
+    path = os.path.join(model_path, filename)
+    if os.path.exists(path):
+        return path
+    stem, ext = os.path.splitext(filename)
+    candidates = sorted(glob.glob(os.path.join(model_path, stem.rsplit('_', 1)[0] + '_*' + ext)))
+    if len(candidates) == 1:
+        logger.info('%s checkpoint: %s', variant, candidates[0])
+        return candidates[0]
+    logger.warning('%s checkpoint %s not found, download it from %s', variant, path, url)
+    return path
+
+# Error message for a device / precision pair that cannot run, else None
+def precision_error(device, precision):
+    if precision == 'int8' and not device.startswith('cpu'):
+        return '--precision int8 is only supported with --device cpu'
+    return None
+
+# threads > 0: torch's intra-op thread count, 0 keeps torch's default
+def set_threads(threads):
+    import torch
+    if threads > 0:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+def autocast_encoder(encoder, device, dtype):
+    import torch
+    device_type = torch.device(device).type
+    forward = encoder.forward
+    def autocast_forward(x):
+        with torch.autocast(device_type, dtype=dtype):
+            return forward(x).float()
+    encoder.forward = autocast_forward
+    return encoder
+
+def quantize_encoder(encoder):
+    import torch
+    return torch.ao.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8)
+
+def load_sam(checkpoint, device='cuda', precision='fp32', threads=0, variant='vit_h'):
+    import importlib
+    import torch
+    package, registry_key, _, _ = VARIANTS[variant]
+    sam_model_registry = importlib.import_module(package).sam_model_registry
+    num_threads = set_threads(threads)
+    sam = sam_model_registry[registry_key](checkpoint=checkpoint)
+    sam.to(device)
+    sam.eval()
+    if precision == 'bf16':
+        autocast_encoder(sam.image_encoder, device, torch.bfloat16)
+    elif precision == 'int8':
+        sam.image_encoder = quantize_encoder(sam.image_encoder)
+    elif precision != 'fp32':
+        raise ValueError('unknown precision %r, choose among: %s' % (precision, ', '.join(PRECISIONS)))
+    logger.info('SAM %s on %s, %s, %s threads', variant, device, precision, num_threads)
+    return sam
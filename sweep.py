@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import logging
+import multiprocessing as mp
+import os
+import sys
+import zlib
+
+from data_utils import list_masks
+
+logger = logging.getLogger(__name__)
+
+####################################################
+# Parallel (dataset, image) sweep over a pool of worker processes
+#   init_fn(*init_args) runs once per worker (e.g. loads the checkpoint) and
+#   its return value is handed to every work_fn(state, (cfg, mask_name)) call.
+#   work_fn returns (im_name, dc_class_tmp) or None for skipped samples.
+# Results are yielded per dataset as (cfg, dc_log, names), in the same
+# order as the sequential loop whatever the number of workers.
+# work_fn and init_fn must be importable (module-level) functions.
+# With a ResultJournal, every result is journaled as it arrives, samples the
+# journal already holds are skipped, and the per-dataset results are read
+# back from the journal.
+# If a worker dies (e.g. out of memory) the sweep raises BrokenProcessPool
+# instead of waiting forever for its results.
+# mask_lists (one per cfg, e.g. from the dataset index) default to list_masks.
+####################################################
+
+_state = None
+
+# Per-unit RNG seed, so prompts do not depend on which worker runs a unit
+def unit_seed(dataset, mask_name):
+    return zlib.crc32(('%s/%s' % (dataset, mask_name)).encode())
+
+def _init_worker(init_fn, init_args, num_threads):
+    global _state
+    # Share the cores between workers instead of oversubscribing them,
+    # without importing torch in workers of backends that never use it
+    # (--model fake): torch reads OMP_NUM_THREADS when it is first imported.
+    # An explicit --threads still wins, init_fn sets it after this.
+    if 'torch' in sys.modules:
+        sys.modules['torch'].set_num_threads(num_threads)
+    else:
+        os.environ['OMP_NUM_THREADS'] = str(num_threads)
+    _state = init_fn(*init_args)
+
+def _run_unit(task):
+    work_fn, unit = task
+    return work_fn(_state, unit)
+
+def run_sweep(cfgs, work_fn, init_fn, init_args=(), workers=1, chunksize=1, journal=None, mask_lists=None):
+    if mask_lists is None:
+        mask_lists = [list_masks(cfg) for cfg in cfgs]
+    units, bounds = [], []
+    for cfg, mask_list in zip(cfgs, mask_lists):
+        # Samples already in the journal of a resumed run are not re-run
+        units += [(cfg, mask_name) for mask_name in mask_list
+                  if journal is None or not journal.done(cfg['name'], mask_name)]
+        bounds.append(len(units))
+    logger.info('# of work units %s', len(units))
+
+    num_threads = max(1, (os.cpu_count() or 1) // workers)
+    # spawn: CUDA cannot be re-initialised in forked children
+    ctx = mp.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker,
+                             initargs=(init_fn, init_args, num_threads)) as pool:
+        results = pool.map(_run_unit, [(work_fn, unit) for unit in units], chunksize=chunksize)
+        start = 0
+        for cfg, mask_list, end in zip(cfgs, mask_lists, bounds):
+            dc_log, names = [], []
+            for i in range(start, end):
+                result = next(results)
+                if journal is not None:
+                    journal.record(cfg['name'], units[i][1], result)
+                if result is not None:
+                    names.append(result[0])
+                    dc_log.append(result[1])
+            start = end
+            if journal is not None:
+                dc_log, names = journal.scores(cfg['name'], mask_list)
+            yield cfg, dc_log, names
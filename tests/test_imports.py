@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from import_time import LAZY, MODULES, import_once
+
+####################################################
+# Entry points import none of the backends and feature-specific
+# dependencies (import_time.LAZY) at import time; each one is imported in a
+# fresh interpreter, as benchmarks/import_time.py does
+####################################################
+
+@pytest.mark.parametrize('module', MODULES)
+def test_no_eager_imports(module):
+    _, loaded, _ = import_once(module)
+    assert loaded == [], '%s imports %s at import time (%s are imported on first use)' % (
+        module, ', '.join(loaded), ', '.join(LAZY))
@@ -0,0 +1,79 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from eval_utils import Mask2Points, Mask2PointsFast, _medial_axis, _skeleton_points
+from region_profile import RegionProfile
+
+####################################################
+# Mask2PointsFast against the current selection (Mask2Points), with the
+# same skeleton seed
+####################################################
+
+# One region: an ellipse (inside the image or cut by its border) or a blob
+# of overlapping random ellipses
+def single_region(kind, size=128):
+    mask = np.zeros((size, size), np.uint8)
+    if kind == 'blob':
+        rng = np.random.RandomState(3)
+        for _ in range(5):
+            center = tuple(int(c) for c in rng.randint(size // 2 - 10, size // 2 + 10, 2))
+            axes = tuple(int(a) for a in rng.randint(8, 30, 2))
+            cv2.ellipse(mask, center, axes, int(rng.randint(180)), 0, 360, 1, -1)
+        return mask
+    center = (size // 2, size // 2) if kind == 'ellipse' else (4, size // 3)
+    cv2.ellipse(mask, center, (40, 18), 30, 0, 360, 1, -1)
+    return mask
+
+@pytest.mark.parametrize('kind', ['ellipse', 'border', 'blob'])
+def test_skeleton_matches_full_size(kind):
+    mask = single_region(kind)
+    profile = RegionProfile(mask)
+    assert profile.num == 1
+    full = np.argwhere(_medial_axis(profile.region_mask(1), 0))
+    np.testing.assert_array_equal(_skeleton_points(profile, [1], 0)[1], full)
+
+@pytest.mark.parametrize('kind', ['ellipse', 'border', 'blob'])
+def test_single_point_matches_mask2points(kind):
+    mask = single_region(kind)
+    fast = Mask2PointsFast(mask, 1)
+    before = Mask2Points(mask, 1, seed=0)
+    assert len(fast) == len(before) == 1
+    np.testing.assert_array_equal(fast[0]['loc'], before[0]['loc'])
+    assert fast[0]['cls'] == before[0]['cls']
+
+def test_all_regions():
+    mask = np.zeros((128, 128), np.uint8)
+    mask[10:40, 10:50] = 1
+    mask[70:120, 60:90] = 2
+    mask[100, 10] = 1    # smaller than 1e-4 of the image: dropped
+    fast = Mask2PointsFast(mask, 3, all_regions=True)
+    assert [profile['cls'] for profile in fast] == [1, 2]
+    profile = RegionProfile(mask)
+    skeletons = _skeleton_points(profile, [1, 2], 0)
+    for region_id, points in zip([1, 2], fast):
+        assert points['loc'].shape == (3, 2)
+        # Every point is an (x, y) of the region's skeleton
+        skeleton = {tuple(p) for p in skeletons[region_id][:, ::-1]}
+        assert {tuple(p) for p in points['loc'].astype(int)} <= skeleton
+    # Without all_regions, only the first region as Mask2Points (its own
+    # skeleton: ties are broken differently than with both regions)
+    first = Mask2PointsFast(mask, 3)
+    assert [profile['cls'] for profile in first] == [1]
+    skeleton = {tuple(p) for p in _skeleton_points(profile, [1], 0)[1][:, ::-1]}
+    assert {tuple(p) for p in first[0]['loc'].astype(int)} <= skeleton
+
+def test_fewer_skeleton_points_than_n():
+    mask = np.zeros((32, 32), np.uint8)
+    mask[10, 10:13] = 1
+    skeleton = np.argwhere(_medial_axis(mask, 0))[:, ::-1]
+    assert 0 < len(skeleton) < 5
+    loc = Mask2PointsFast(mask, 5)[0]['loc']
+    assert loc.shape == (5, 2)
+    # Every point is one of the skeleton, and all of them are used
+    assert {tuple(p) for p in loc.astype(int)} == {tuple(p) for p in skeleton}
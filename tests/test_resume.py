@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'prompt_gen_and_exec_v1.py')
+JOURNAL = os.path.join('scores', 'v1_rerun', 'fake_journal.jsonl')
+RESULTS = os.path.join('scores', 'v1_rerun', 'fake_results_resume.npz')
+
+####################################################
+# A run interrupted and restarted with --resume rebuilds the same score
+# arrays as an uninterrupted run. The v1 protocol runs on --model fake (no
+# weights) over two-class masks of rectangles, whose clicks are drawn among
+# many tied pixels, so the scores depend on the prompt random stream. The
+# interruption keeps the journal of the straight run up to its third
+# sample, followed by a line torn by the crash.
+####################################################
+
+def write_dataset(init_path, num_images=6, size=96):
+    rng = np.random.RandomState(0)
+    root = os.path.join(init_path, 'sa_resume')
+    os.makedirs(os.path.join(root, 'images'))
+    os.makedirs(os.path.join(root, 'masks'))
+    for n in range(num_images):
+        mask = np.zeros((size, size), np.uint8)
+        # One empty mask, skipped by the scripts
+        for cls in ([] if n == 2 else [1, 2]):
+            x, y = rng.randint(0, size // 2, 2)
+            w, h = 2 * rng.randint(6, size // 4, 2)
+            mask[y:y+h, x:x+w] = cls
+        image = rng.randint(0, 200, (size, size, 3)).astype(np.uint8)
+        cv2.imwrite(os.path.join(root, 'masks', 'im%d.png' % n), mask)
+        cv2.imwrite(os.path.join(root, 'images', 'im%d.png' % n), image)
+    registry = os.path.join(init_path, 'registry.json')
+    with open(registry, 'w') as f:
+        json.dump({'defaults': {'root': 'sa_{name}', 'images': 'images', 'masks': 'masks', 'num_class': 1},
+                   'datasets': {'resume': {'num_class': 2}}}, f)
+    return registry
+
+def run(cwd, init_path, registry, *extra):
+    os.makedirs(os.path.join(cwd, 'scores', 'v1_rerun'), exist_ok=True)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, SCRIPT, '--model', 'fake', '--num-prompt', '4', '--init-path', init_path,
+                    '--dataset', 'resume', '--registry', registry, '--index-dir', os.path.join(cwd, 'index'),
+                    '--log-level', 'warning'] + list(extra), cwd=cwd, env=env, check=True)
+    with np.load(os.path.join(cwd, RESULTS)) as f:
+        return f['names'].tolist(), f['scores']
+
+def test_resume_matches_straight_run(tmp_path):
+    init_path = str(tmp_path / 'data')
+    registry = write_dataset(init_path)
+
+    straight = str(tmp_path / 'straight')
+    names, scores = run(straight, init_path, registry)
+    assert len(names) == 5
+
+    resumed = str(tmp_path / 'resumed')
+    os.makedirs(os.path.join(resumed, 'scores', 'v1_rerun'))
+    with open(os.path.join(straight, JOURNAL)) as f:
+        lines = f.readlines()
+    # Header, 3 samples (one of them the skipped empty mask), half a line
+    with open(os.path.join(resumed, JOURNAL), 'w') as f:
+        f.writelines(lines[:4])
+        f.write(lines[4][:len(lines[4]) // 2])
+    resumed_names, resumed_scores = run(resumed, init_path, registry, '--resume')
+
+    assert resumed_names == names
+    np.testing.assert_array_equal(resumed_scores, scores)
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import eval_volumes
+import protocols
+
+torch = pytest.importorskip('torch')
+
+####################################################
+# Carry of an object past its last slice in the volume protocol. SAM is
+# replaced by a decoder that predicts the same large square whatever the
+# prompt (the worst case of a stale click, never an empty mask) and by a
+# predictor recording the slices it encodes, so the carry only stops at
+# --carry-slices, or at once when --carry-area exceeds the square's area
+# over the object's.
+####################################################
+
+SIZE = 64
+
+class RecordingPredictor:
+    def __init__(self):
+        self.images = []
+
+    def set_image(self, input_array):
+        self.images.append(int(input_array[0, 0, 0]))
+
+def fake_decode(predictor, point_coords=None, point_labels=None, boxes=None, mask_input=None, multimask_output=True):
+    return torch.zeros(1, 3, 256, 256), torch.zeros(1, 3)
+
+def fake_upscale(predictor, low_res, size=None):
+    logits = torch.full((1, low_res.shape[1], SIZE, SIZE), -1.0)
+    logits[..., 8:40, 8:40] = 1.0
+    return logits
+
+# Volume of 10 slices, class 1 on slices 2-4; the first pixel of each image
+# is its slice number
+def write_volume(root):
+    cfg = {'name': 'vol', 'img_dir': os.path.join(root, 'images'), 'seg_dir': os.path.join(root, 'masks'),
+           'num_class': 1}
+    os.makedirs(cfg['img_dir'])
+    os.makedirs(cfg['seg_dir'])
+    slices = []
+    for z in range(10):
+        mask = np.zeros((SIZE, SIZE), np.uint8)
+        if 2 <= z <= 4:
+            mask[10:30, 10:30] = 1
+        image = np.full((SIZE, SIZE, 3), 100, np.uint8)
+        image[0, 0] = z
+        image[1, 1] = 255
+        name = 'case_slice_%02d.png' % z
+        cv2.imwrite(os.path.join(cfg['seg_dir'], name), mask)
+        cv2.imwrite(os.path.join(cfg['img_dir'], name), image)
+        slices.append(name)
+    return cfg, slices
+
+@pytest.mark.parametrize('carry_slices, carry_area, carried', [(0, 0.1, 0), (2, 0.1, 2), (2, 3.0, 1)])
+def test_carry_is_bounded(tmp_path, monkeypatch, carry_slices, carry_area, carried):
+    monkeypatch.setattr(protocols, 'decode', fake_decode)
+    monkeypatch.setattr(protocols, 'upscale', fake_upscale)
+    cfg, slices = write_volume(str(tmp_path))
+    args = argparse.Namespace(prefetch=0, io_threads=1, oracle=False, score_res=0,
+                              carry_slices=carry_slices, carry_area=carry_area)
+    predictor = RecordingPredictor()
+    summary = eval_volumes.evaluate_volume(predictor, None, args, cfg, 'case', slices)
+
+    # The empty slices after the carry are never encoded
+    assert predictor.images == list(range(2, 5 + carried))
+    assert summary['carried_slices'] == [carried]
+    assert summary['decoder_calls'] == 3 + carried
+    # Square of 32x32 predicted on every slice, object of 20x20 on 3 of them
+    inter, pred = 3 * 20 * 20, (3 + carried) * 32 * 32
+    assert summary['iou3d'][0] == pytest.approx(inter / pred)
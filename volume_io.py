@@ -0,0 +1,176 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+####################################################
+# Slices of NIfTI / DICOM volumes, read lazily without a PNG export
+#   A NIfTI mask volume <seg_dir>/<case>.nii[.gz] stands for all its axial
+#   slices; each one is a sample named '<case>.nii[.gz]:<slice>' (see
+#   data_utils.list_masks), read on demand by load_mask/load_image.
+#   The image of a case is <img_dir>/<same file name> (NIfTI) or a DICOM
+#   series directory <img_dir>/<case>/, sorted along the patient z axis; it
+#   must have the same slice order and in-plane orientation as the mask
+#   (NIfTI slices are transposed to rows x cols, nothing else is flipped).
+# Uncompressed NIfTI files are memory-mapped, so a slice only reads its own
+# pages (NIfTI is stored x-fastest, an axial slice is contiguous). .nii.gz
+# cannot be mapped: nibabel decompresses up to the slice (fast random access
+# with the indexed_gzip package). DICOM files hold one slice each, and only
+# the headers are read up front.
+# Needs nibabel (and pydicom for DICOM), imported on first use.
+####################################################
+
+NIFTI_EXTS = ('.nii', '.nii.gz')
+
+# (center, width) windows in HU for CT
+WINDOWS = {
+    'abdomen': (40, 400),
+    'liver': (60, 160),
+    'lung': (-600, 1500),
+    'bone': (400, 1800),
+    'brain': (40, 80),
+}
+
+def is_nifti(name):
+    return name.endswith(NIFTI_EXTS)
+
+def _case_name(file_name):
+    for ext in sorted(NIFTI_EXTS, key=len, reverse=True):
+        if file_name.endswith(ext):
+            return file_name[:-len(ext)]
+    return file_name
+
+def slice_name(file_name, index):
+    return '%s:%04d' % (file_name, index)
+
+# (file name, slice index) of a slice sample, or None for plain image files
+def split_slice_name(name):
+    file_name, sep, index = name.rpartition(':')
+    if not sep or not is_nifti(file_name) or not index.isdigit():
+        return None
+    return file_name, int(index)
+
+####################################################
+# Windowing of a 2D slice to uint8 RGB
+# input: window
+#   (center, width), a name of WINDOWS, or None: the range between the
+#   0.5 and 99.5 percentiles of the slice, which suits MRI (arbitrary
+#   intensity units) and ignores the odd very bright voxel that made
+#   x / max(x) * 255 put most of the tissue in a few grey levels
+####################################################
+def window_to_uint8(pixels, window=None):
+    pixels = np.asarray(pixels, dtype=np.float32)
+    if isinstance(window, str):
+        window = WINDOWS[window]
+    if window is None:
+        low, high = np.percentile(pixels, (0.5, 99.5))
+    else:
+        center, width = window
+        low, high = center - width / 2, center + width / 2
+    scale = 255 / max(high - low, 1e-6)
+    # In place on the float copy: subtract, scale, clip, then one uint8 cast
+    pixels -= low
+    pixels *= scale
+    np.clip(pixels, 0, 255, out=pixels)
+    gray = pixels.astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+class NiftiVolume:
+    def __init__(self, path):
+        import nibabel as nib
+        self.image = nib.load(path, mmap=True)
+        self.shape = self.image.shape
+        self.window = None
+        # One reader at a time: gzip streams are not thread-safe
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.shape[2]
+
+    # Slice as rows x cols (y, x), as the PNG exports are oriented
+    def slice(self, index):
+        with self.lock:
+            pixels = np.asanyarray(self.image.dataobj[:, :, index])
+        return pixels.T
+
+class DicomSeries:
+    def __init__(self, directory):
+        import pydicom
+        self._pydicom = pydicom
+        headers = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                header = pydicom.dcmread(path, stop_before_pixels=True)
+            except Exception:
+                continue
+            if 'ImagePositionPatient' in header:
+                position = float(header.ImagePositionPatient[2])
+            else:
+                position = float(getattr(header, 'InstanceNumber', 0))
+            headers.append((position, path, header))
+        if not headers:
+            raise ValueError('no DICOM files in %s' % directory)
+        headers.sort(key=lambda h: h[0])
+        self.paths = [path for _, path, _ in headers]
+        first = headers[0][2]
+        self.window = None
+        if 'WindowCenter' in first and 'WindowWidth' in first:
+            # Multi-valued in some series: the first window is the default one
+            self.window = (float(np.atleast_1d(first.WindowCenter)[0]), float(np.atleast_1d(first.WindowWidth)[0]))
+
+    def __len__(self):
+        return len(self.paths)
+
+    # Slice in HU (rescale slope/intercept applied)
+    def slice(self, index):
+        ds = self._pydicom.dcmread(self.paths[index])
+        pixels = ds.pixel_array.astype(np.float32)
+        return pixels * float(getattr(ds, 'RescaleSlope', 1)) + float(getattr(ds, 'RescaleIntercept', 0))
+
+####################################################
+# Open volumes, shared by the loader threads
+#   Keeps the last max_open volumes open (a file handle / memory map each),
+#   since the samples of a dataset come volume by volume.
+####################################################
+class VolumeCache:
+    def __init__(self, max_open=8):
+        self.max_open = max_open
+        self.volumes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, opener):
+        with self.lock:
+            if path in self.volumes:
+                self.volumes.move_to_end(path)
+                return self.volumes[path]
+        volume = opener(path)
+        with self.lock:
+            volume = self.volumes.setdefault(path, volume)
+            while len(self.volumes) > self.max_open:
+                self.volumes.popitem(last=False)
+        return volume
+
+_volumes = VolumeCache()
+
+# Sample names of the slices of a NIfTI mask volume of seg_dir
+def list_slices(seg_dir, file_name):
+    return [slice_name(file_name, i) for i in range(len(_volumes.get(os.path.join(seg_dir, file_name), NiftiVolume)))]
+
+def read_mask_slice(cfg, name):
+    file_name, index = split_slice_name(name)
+    volume = _volumes.get(os.path.join(cfg['seg_dir'], file_name), NiftiVolume)
+    return np.uint8(volume.slice(index))
+
+# Windowed uint8 RGB slice of the image volume matching a mask slice; the
+# window is cfg['window'] if given, else the DICOM header's, else per slice
+def read_image_slice(cfg, name):
+    file_name, index = split_slice_name(name)
+    path = os.path.join(cfg['img_dir'], file_name)
+    if os.path.exists(path):
+        volume = _volumes.get(path, NiftiVolume)
+    else:
+        volume = _volumes.get(os.path.join(cfg['img_dir'], _case_name(file_name)), DicomSeries)
+    window = cfg.get('window') or volume.window
+    return window_to_uint8(volume.slice(index), window)
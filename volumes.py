@@ -0,0 +1,77 @@
+import re
+
+import numpy as np
+
+from metrics import overlap_counts
+
+####################################################
+# Volumes of 2D slice datasets
+#   CT/MRI datasets (BraTS, CT-Organ, CT-Liver, prostate, ...) are exported
+#   as one mask/image per slice, and the slices of a volume share their file
+#   name up to the slice number. By default the slice index is the last
+#   number in the mask name and the volume id is the name without it, e.g.
+#     liver_7_slice_012.png -> ('liver_7_slice_.png', 12)
+#   A regex with named groups 'volume' and 'slice' can be given instead
+#   (cfg['volume_pattern'], --volume-pattern).
+####################################################
+
+_LAST_NUMBER = re.compile(r'^(.*?)(\d+)(\D*)$')
+
+def slice_key(mask_name, pattern=None):
+    if pattern is not None:
+        match = re.match(pattern, mask_name)
+        if match is None:
+            raise ValueError('%s does not match the volume pattern %s' % (mask_name, pattern))
+        return match.group('volume'), int(match.group('slice'))
+    match = _LAST_NUMBER.match(mask_name)
+    if match is None:
+        return mask_name, 0
+    return match.group(1) + match.group(3), int(match.group(2))
+
+# [(volume_id, [mask names in slice order])], volumes in order of first appearance
+def group_volumes(mask_list, pattern=None):
+    volumes = {}
+    for mask_name in mask_list:
+        volume, index = slice_key(mask_name, pattern)
+        volumes.setdefault(volume, []).append((index, mask_name))
+    return [(volume, [mask_name for _, mask_name in sorted(slices)]) for volume, slices in volumes.items()]
+
+####################################################
+# Scores of one volume, per class
+#   3D IoU: intersections and unions summed over the slices before dividing,
+#   so large slices weigh more than in the mean of the 2D IoUs. The union
+#   also counts what is predicted on slices where the class is absent (the
+#   prediction carried past the end of the object, add_absent, at most a
+#   few slices: protocols.volume_protocol_image); NaN if the class is
+#   neither present nor predicted. The mean 2D IoU is over the slices where
+#   the class is present, carried counts the slices it was carried onto.
+####################################################
+class VolumeScores:
+    def __init__(self, num_class):
+        self.inter = np.zeros(num_class, dtype=np.int64)
+        self.union = np.zeros(num_class, dtype=np.int64)
+        self.slice_ious = [[] for _ in range(num_class)]
+        self.carried = np.zeros(num_class, dtype=np.int64)
+        self.slices = 0
+        self.decoder_calls = 0
+
+    def add(self, cls, pred, gt):
+        inter, area_pred, area_gt = overlap_counts(pred, gt)
+        self.inter[cls] += inter
+        self.union[cls] += area_pred + area_gt - inter
+        self.slice_ious[cls].append(float(inter / (area_pred + area_gt - inter)))
+
+    # Prediction on a slice where the class is absent: all false positive
+    def add_absent(self, cls, pred):
+        self.union[cls] += np.count_nonzero(pred)
+        self.carried[cls] += 1
+
+    def iou3d(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.union > 0, self.inter / self.union, np.nan)
+
+    def summary(self, volume):
+        return {'volume': volume, 'slices': self.slices, 'decoder_calls': self.decoder_calls,
+                'iou3d': [None if np.isnan(iou) else float(iou) for iou in self.iou3d()],
+                'iou2d_mean': [float(np.mean(ious)) if ious else None for ious in self.slice_ious],
+                'carried_slices': self.carried.tolist()}